@@ -1,58 +1,62 @@
 import os
-import networkx as nx
-from bs4 import BeautifulSoup
-import torch
-from torch_geometric.data import Data
-from torch_geometric.loader import DataLoader
-import openai
-from utils.graphsage import GraphSAGE
-from dotenv import load_dotenv
-from sklearn.manifold import TSNE
-import matplotlib.pyplot as plt
-from sklearn.metrics.pairwise import cosine_similarity
-
-load_dotenv()
-
-api_key = os.getenv("OPENAI_API_KEY")
-openai.api_key = api_key
+from utils.embedding import embedding_matrix, get_ada_embeddings
+from utils.dom_graph import build_dom_graph, node_records
+from utils.parsing import make_soup
+from utils.distance import find_discrepancies, iter_distance_blocks, pairwise_distances
+from utils.config import configure_openai
+from utils.splitter import split_views
+from utils.streaming import graph_from_events, iter_dom_events, read_chunks
 
 def get_ada_embedding(text):
-    return openai.Embedding.create(input=[text], model='text-embedding-ada-002').data[0].embedding
-
-def convert_html_to_graph(html_doc):
-    soup = BeautifulSoup(html_doc, 'html.parser')
-    graph = nx.Graph()
-
-    for element in soup.find_all():
-        graph.add_node(str(element))
-    return graph
-
-def generate_node_features(graph):
-    ada_embedding_size = 1536 
-    zero_vector = [0] * ada_embedding_size
-
-    for node in graph.nodes:
-        soup_node = BeautifulSoup(node, 'html.parser').find()
-        if soup_node and soup_node.string:
-            graph.nodes[node]['feature'] = get_ada_embedding(soup_node.string)
-        else:
-            graph.nodes[node]['feature'] = zero_vector
+    return get_ada_embeddings([text])[0]
+
+def convert_html_to_graph(html_doc, siblings=False, aria_refs=False, parser=None):
+    soup = make_soup(html_doc, parser)
+    # Nodes are keyed by integer id, with tag, attrs, direct text and DOM path stored on each node
+    return build_dom_graph(node_records(soup), siblings=siblings, aria_refs=aria_refs)
+
+# Streaming variant for very large pages: the file is parsed chunk by chunk and node records
+# and edges are produced incrementally, so parser memory is bounded by the DOM depth
+def convert_html_file_to_graph(path, view=None, siblings=False, aria_refs=False):
+    return graph_from_events(iter_dom_events(read_chunks(path), siblings=siblings, aria_refs=aria_refs, view=view))
+
+def generate_node_features(graph, dtype='float32'):
+    # Features live in one contiguous matrix, graph.graph['features'], with a row per node in graph.nodes
+    # order; the selected embedding provider (OpenAI ADA by default) fixes the width, and text-less nodes
+    # keep zero rows. Texts are embedded in batches so repeated and cached strings cost no extra round trips
+    texts = [graph.nodes[node]['text'] for node in graph.nodes]
+    graph.graph['features'] = embedding_matrix(texts, dtype=dtype)
     return graph
 
 def print_node_features(graph, name):
     print(f"Node features for {name}:")
-    for i, node in enumerate(graph.nodes):
-        feature = graph.nodes[node]['feature']
+    for i, feature in enumerate(graph.graph['features']):
         print(f"Node {i}: {feature[:5]}...")  # Print first 5 elements for brevity
 
-def nx_to_torch_geometric(graph):
+def nx_to_torch_geometric(graph, edge_mode='dom', edge_index=None):
+    import torch
+    from torch_geometric.data import Data
+
     nodes = list(graph.nodes)
     node_mapping = {node: i for i, node in enumerate(nodes)}
-    
-    edges = [(node_mapping[src], node_mapping[dst]) for src in nodes for dst in nodes if src != dst]
-    edge_index = torch.tensor(edges, dtype=torch.long).t().contiguous()
 
-    features = torch.tensor([graph.nodes[node]['feature'] for node in nodes], dtype=torch.float)
+    if edge_index is not None:
+        # A stored (2, E) edge_index, e.g. a read-only memory map from the artifact store, which torch needs copied
+        edge_index = torch.from_numpy(np.array(edge_index, dtype=np.int64))
+    else:
+        if edge_mode == 'dom':
+            # DOM edges in both directions, linear in the number of nodes
+            edges = [(node_mapping[src], node_mapping[dst]) for src, dst in graph.edges if src != dst]
+            edges += [(dst, src) for src, dst in edges]
+        elif edge_mode == 'complete':
+            # Every ordered pair of nodes, kept to compare against earlier results
+            edges = [(node_mapping[src], node_mapping[dst]) for src in nodes for dst in nodes if src != dst]
+        else:
+            raise ValueError("Unsupported edge mode")
+        edge_index = torch.tensor(edges, dtype=torch.long).reshape(-1, 2).t().contiguous()
+
+    # Share the float32 feature matrix with torch instead of converting nested lists
+    features = torch.from_numpy(np.asarray(graph.graph['features'], dtype=np.float32))
     
     num_nodes = len(nodes)
     train_mask = torch.zeros(num_nodes, dtype=torch.bool)
@@ -111,36 +115,40 @@ def nx_to_torch_geometric(graph):
 
 import numpy as np
 
-def calculate_similarities_euclidean(data, model):
+def calculate_similarities_euclidean(data, model, verbose=True):
+    from torch_geometric.loader import DataLoader
+
     loader = DataLoader([data], batch_size=1)
     model.eval()
     initial_embeddings = model(data.x, data.edge_index).detach().numpy()
     model.train()
-    model.fit(data, loader, epochs=100)
+    model.fit(data, loader, epochs=100, verbose=verbose)
     model.eval()
     trained_embeddings = model(data.x, data.edge_index).detach().numpy()
     return initial_embeddings, trained_embeddings
 
-def add_euclidean_distance_weights(graph, embeddings):
+def add_euclidean_distance_weights(graph, embeddings, block_size=1024):
     node_list = list(graph.nodes)
-    for i, src in enumerate(node_list):
-        for j, dst in enumerate(node_list):
-            if i != j:
-                distance = np.linalg.norm(embeddings[i] - embeddings[j])
-                graph.add_edge(src, dst, weight=distance)
+    # Distances are symmetric, so the upper triangle covers every undirected edge
+    for row_start, col_start, block in iter_distance_blocks(embeddings, 'euclidean', block_size, upper=True):
+        i, j = np.nonzero(np.triu(np.ones(block.shape, dtype=bool), k=row_start - col_start + 1))
+        graph.add_weighted_edges_from(
+            (node_list[row_start + a], node_list[col_start + b], distance)
+            for a, b, distance in zip(i.tolist(), j.tolist(), block[i, j].tolist())
+        )
     return graph
 
-def compare_graphs_euclidean(normal_graph, impaired_graph, normal_embeddings, impaired_embeddings):
-    discrepancies = []
-    for i in range(len(normal_embeddings)):
-        for j in range(i + 1, len(normal_embeddings)):
-            normal_dist = np.linalg.norm(normal_embeddings[i] - normal_embeddings[j])
-            impaired_dist = np.linalg.norm(impaired_embeddings[i] - impaired_embeddings[j])
-            if normal_dist < 0.1 and impaired_dist > 0.1:  # Adjusted thresholds
-                discrepancies.append((i, j, normal_dist, impaired_dist))
-    return discrepancies
+def compare_graphs_euclidean(normal_graph, impaired_graph, normal_embeddings, impaired_embeddings, metric='euclidean',
+                             method='auto'):
+    # Pairs close in the normal graph but far apart in the impaired one, as arrays; large pages only
+    # visit the radius neighbours of each node (method='tree', see utils/distance.py)
+    return find_discrepancies(normal_embeddings, impaired_embeddings, metric=metric,
+                              normal_threshold=0.1, impaired_threshold=0.1, method=method)  # Adjusted thresholds
 
 def visualize_embeddings(embeddings, title):
+    from sklearn.manifold import TSNE
+    import matplotlib.pyplot as plt
+
     tsne_model = TSNE(n_components=2, perplexity=5, random_state=42)
     embeddings_2d = tsne_model.fit_transform(embeddings)
     plt.figure(figsize=(10, 10))
@@ -148,73 +156,208 @@ def visualize_embeddings(embeddings, title):
     plt.scatter(embeddings_2d[:, 0], embeddings_2d[:, 1], s=20)
     plt.show()
 
-# Read HTML file content
-normal_file_path = os.path.join(os.path.dirname(__file__), 'output/visual_output.html')
-impaired_file_path = os.path.join(os.path.dirname(__file__), 'output/impaired_output.html')
-
-with open(normal_file_path, 'r', encoding='utf-8') as file:
-    normal_html_doc = file.read()
-
-with open(impaired_file_path, 'r', encoding='utf-8') as file:
-    impaired_html_doc = file.read()
-
-# Convert HTML to graph
-normal_graph = convert_html_to_graph(normal_html_doc)
-impaired_graph = convert_html_to_graph(impaired_html_doc)
-
-# Generate node features
-normal_graph = generate_node_features(normal_graph)
-impaired_graph = generate_node_features(impaired_graph)
-
-# Print node features
-print_node_features(normal_graph, "Normal Graph")
-print_node_features(impaired_graph, "Impaired Graph")
-
-# Convert to PyTorch Geometric graph
-normal_data = nx_to_torch_geometric(normal_graph)
-impaired_data = nx_to_torch_geometric(impaired_graph)
-
-# Check if data contains the correct masks and labels
-print(f"Train Mask (Normal): {normal_data.train_mask}")
-print(f"Validation Mask (Normal): {normal_data.val_mask}")
-print(f"Test Mask (Normal): {normal_data.test_mask}")
-print(f"Labels (Normal): {normal_data.y}")
-
-print(f"Train Mask (Impaired): {impaired_data.train_mask}")
-print(f"Validation Mask (Impaired): {impaired_data.val_mask}")
-print(f"Test Mask (Impaired): {impaired_data.test_mask}")
-print(f"Labels (Impaired): {impaired_data.y}")
-
-# Calculate similarities
-initial_normal_embeddings, trained_normal_embeddings = calculate_similarities_euclidean(normal_data, GraphSAGE(dim_in=normal_data.num_node_features, dim_h=128, dim_out=128))
-initial_impaired_embeddings, trained_impaired_embeddings = calculate_similarities_euclidean(impaired_data, GraphSAGE(dim_in=impaired_data.num_node_features, dim_h=128, dim_out=128))
-
-# Print embeddings before and after training
-print("Initial Normal Embeddings:\n", initial_normal_embeddings)
-print("Trained Normal Embeddings:\n", trained_normal_embeddings)
-print("Initial Impaired Embeddings:\n", initial_impaired_embeddings)
-print("Trained Impaired Embeddings:\n", trained_impaired_embeddings)
-
-# Add cosine similarity weights
-normal_graph = add_euclidean_distance_weights(normal_graph, trained_normal_embeddings)
-impaired_graph = add_euclidean_distance_weights(impaired_graph, trained_impaired_embeddings)
-
-# Print similarity matrices for debugging
-normal_sim_matrix = cosine_similarity(trained_normal_embeddings)
-impaired_sim_matrix = cosine_similarity(trained_impaired_embeddings)
-print("Normal Similarity Matrix:\n", normal_sim_matrix)
-print("Impaired Similarity Matrix:\n", impaired_sim_matrix)
-
-# Compare graphs
-discrepancies = compare_graphs_euclidean(normal_graph, impaired_graph, trained_normal_embeddings, trained_impaired_embeddings)
-
-# Print discrepancies
-print("Discrepancies between normal and impaired graphs:")
-for i, j, normal_sim, impaired_sim in discrepancies:
-    print(f"Nodes {i} and {j}: Normal similarity = {normal_sim:.2f}, Impaired similarity = {impaired_sim:.2f}")
-
-# # Visualize embeddings
-# visualize_embeddings(initial_normal_embeddings, "Initial Normal Embeddings")
-# visualize_embeddings(trained_normal_embeddings, "Trained Normal Embeddings")
-# visualize_embeddings(initial_impaired_embeddings, "Initial Impaired Embeddings")
-# visualize_embeddings(trained_impaired_embeddings, "Trained Impaired Embeddings")
+# Function to run the full pipeline on a normal/impaired page pair and return the discrepancies
+def score_pages(normal_html_doc, impaired_html_doc, edge_mode='dom', encoder_path=None, verbose=True):
+    # Convert HTML to graph
+    normal_graph = convert_html_to_graph(normal_html_doc)
+    impaired_graph = convert_html_to_graph(impaired_html_doc)
+    return score_graphs(normal_graph, impaired_graph, edge_mode=edge_mode, encoder_path=encoder_path, verbose=verbose)
+
+# Function to score an original page directly: the splitter's node records feed the graph builder
+# without writing and re-parsing the visual/impaired HTML files
+def score_page(html_content, edge_mode='dom', encoder_path=None, verbose=True):
+    views = split_views(html_content)
+    normal_graph = build_dom_graph(views.visual_records)
+    impaired_graph = build_dom_graph(views.impaired_records)
+    return score_graphs(normal_graph, impaired_graph, edge_mode=edge_mode, encoder_path=encoder_path, verbose=verbose)
+
+# Function to score an original page file with the streaming parser, one pass per view
+def score_page_file(path, edge_mode='dom', encoder_path=None, verbose=True):
+    normal_graph = convert_html_file_to_graph(path, view='visual')
+    impaired_graph = convert_html_file_to_graph(path, view='impaired')
+    return score_graphs(normal_graph, impaired_graph, edge_mode=edge_mode, encoder_path=encoder_path, verbose=verbose)
+
+# Function to score an original page through the artifact store (see utils/artifacts.py): each stage's
+# output is saved as it completes, so a rerun after a crash resumes after the last finished stage
+def score_page_staged(html_content, store=None, edge_mode='dom', encoder_path=None):
+    from utils.artifacts import ArtifactStore, page_hash
+    from utils.embedding import get_embedding_provider
+    from utils.graphsage import GraphSAGE
+    from utils.parsing import get_parser
+
+    store = store or ArtifactStore()
+    page = page_hash(html_content)
+    views = ('visual', 'impaired')
+
+    # Node tables of both views; backends can build different trees, so the parser is part of the key
+    parser = get_parser()
+    nodes = store.load(page, 'nodes', parser)
+    if nodes is None:
+        split = split_views(html_content, parser=parser)
+        nodes = {'visual': split.visual_records, 'impaired': split.impaired_records}
+        store.save(page, 'nodes', tables=nodes, variant=parser)
+    graphs = {view: build_dom_graph(nodes[view]) for view in views}
+
+    # Feature matrices, which cost an embedding call per new text
+    provider = get_embedding_provider()
+    feature_variant = f"{parser}:{provider.name}:{provider.dim}"
+    features = store.load(page, 'features', feature_variant)
+    if features is None:
+        features = {view: generate_node_features(graphs[view]).graph['features'] for view in views}
+        store.save(page, 'features', arrays=features, variant=feature_variant)
+    for view in views:
+        # Copy out of the read-only memory map, which torch cannot share
+        graphs[view].graph['features'] = np.array(features[view])
+
+    # Edge lists in the encoder's input format
+    edge_variant = f"{parser}:{edge_mode}"
+    edges = store.load(page, 'edges', edge_variant)
+    data = {view: nx_to_torch_geometric(graphs[view], edge_mode=edge_mode,
+                                        edge_index=edges[view] if edges is not None else None) for view in views}
+    if edges is None:
+        store.save(page, 'edges', arrays={view: data[view].edge_index.numpy() for view in views},
+                   variant=edge_variant)
+
+    # Initial and trained embeddings; per-page training is random, so a rerun reuses its stored outcome
+    encoder_key = f"{os.path.abspath(encoder_path)}:{os.path.getmtime(encoder_path)}" if encoder_path else 'per-page'
+    embedding_variant = f"{feature_variant}:{edge_mode}:{encoder_key}"
+    embeddings = store.load(page, 'embeddings', embedding_variant)
+    if embeddings is None:
+        embeddings = {}
+        if encoder_path:
+            encoder = GraphSAGE.load(encoder_path, dim_in=provider.dim)
+            for view in views:
+                embeddings[f'trained_{view}'] = encoder.embed(data[view])
+        else:
+            for view in views:
+                model = GraphSAGE(dim_in=data[view].num_node_features, dim_h=128, dim_out=128)
+                embeddings[f'initial_{view}'], embeddings[f'trained_{view}'] = \
+                    calculate_similarities_euclidean(data[view], model)
+        store.save(page, 'embeddings', arrays=embeddings, variant=embedding_variant)
+
+    return compare_graphs_euclidean(graphs['visual'], graphs['impaired'],
+                                    embeddings['trained_visual'], embeddings['trained_impaired'])
+
+# Function to embed the nodes of both views of a page for the corpus store (see utils/corpus.py): the
+# encoder output when a shared pretrained encoder is given, else the node features, which are comparable
+# across pages as they are (per-page trained embeddings are not)
+def page_node_embeddings(html_content, encoder=None, edge_mode='dom'):
+    views = split_views(html_content)
+    embedded = {}
+    for view, records in (('visual', views.visual_records), ('impaired', views.impaired_records)):
+        graph = generate_node_features(build_dom_graph(records))
+        if encoder is not None:
+            embedded[view] = (records, encoder.embed(nx_to_torch_geometric(graph, edge_mode=edge_mode)))
+        else:
+            embedded[view] = (records, graph.graph['features'])
+    return embedded
+
+# Function to re-score a page that was scored before, recomputing only what its edits affect
+# (see utils/incremental.py); needs a pretrained encoder, since per-page training changes every embedding
+def score_page_incremental(html_content, page_key, encoder_path, store_dir=None):
+    from utils.embedding import get_embedding_provider
+    from utils.graphsage import GraphSAGE
+    from utils.incremental import DEFAULT_STORE_DIR, IncrementalScorer
+
+    # The checkpoint's path and modification time identify the encoder whose results were stored
+    encoder_key = f"{os.path.abspath(encoder_path)}:{os.path.getmtime(encoder_path)}"
+    encoder = GraphSAGE.load(encoder_path, dim_in=get_embedding_provider().dim)
+    scorer = IncrementalScorer(encoder, encoder_key=encoder_key, store_dir=store_dir or DEFAULT_STORE_DIR)
+    views = split_views(html_content)
+    discrepancies = scorer.score(page_key, views.visual_records, views.impaired_records)
+    stats = scorer.last_stats
+    print(f"Re-embedded {stats['reembedded']} and re-encoded {stats['reencoded']} of {stats['nodes']} nodes"
+          f"{' (first run)' if stats['full'] else ''}")
+    return discrepancies
+
+# Function to run the rest of the pipeline on the two graphs of a page
+def score_graphs(normal_graph, impaired_graph, edge_mode='dom', encoder_path=None, verbose=True, encoder=None):
+    from utils.graphsage import GraphSAGE
+
+    # Generate node features
+    normal_graph = generate_node_features(normal_graph)
+    impaired_graph = generate_node_features(impaired_graph)
+
+    # Print node features
+    if verbose:
+        print_node_features(normal_graph, "Normal Graph")
+        print_node_features(impaired_graph, "Impaired Graph")
+
+    # Convert to PyTorch Geometric graph ('dom' edges, or 'complete' for the all-pairs graph)
+    normal_data = nx_to_torch_geometric(normal_graph, edge_mode=edge_mode)
+    impaired_data = nx_to_torch_geometric(impaired_graph, edge_mode=edge_mode)
+
+    # Check if data contains the correct masks and labels
+    if verbose:
+        print(f"Train Mask (Normal): {normal_data.train_mask}")
+        print(f"Validation Mask (Normal): {normal_data.val_mask}")
+        print(f"Test Mask (Normal): {normal_data.test_mask}")
+        print(f"Labels (Normal): {normal_data.y}")
+
+        print(f"Train Mask (Impaired): {impaired_data.train_mask}")
+        print(f"Validation Mask (Impaired): {impaired_data.val_mask}")
+        print(f"Test Mask (Impaired): {impaired_data.test_mask}")
+        print(f"Labels (Impaired): {impaired_data.y}")
+
+    # Calculate similarities: with a pretrained encoder (see train_encoder.py) only the forward pass runs;
+    # callers scoring many pages can pass the loaded encoder instead of its path
+    if encoder is None and encoder_path:
+        encoder = GraphSAGE.load(encoder_path, dim_in=normal_data.num_node_features)
+    if encoder is not None:
+        initial_normal_embeddings = initial_impaired_embeddings = None
+        trained_normal_embeddings = encoder.embed(normal_data)
+        trained_impaired_embeddings = encoder.embed(impaired_data)
+    else:
+        initial_normal_embeddings, trained_normal_embeddings = calculate_similarities_euclidean(normal_data, GraphSAGE(dim_in=normal_data.num_node_features, dim_h=128, dim_out=128), verbose=verbose)
+        initial_impaired_embeddings, trained_impaired_embeddings = calculate_similarities_euclidean(impaired_data, GraphSAGE(dim_in=impaired_data.num_node_features, dim_h=128, dim_out=128), verbose=verbose)
+
+    if verbose:
+        # Print embeddings before and after training
+        print("Initial Normal Embeddings:\n", initial_normal_embeddings)
+        print("Trained Normal Embeddings:\n", trained_normal_embeddings)
+        print("Initial Impaired Embeddings:\n", initial_impaired_embeddings)
+        print("Trained Impaired Embeddings:\n", trained_impaired_embeddings)
+
+        # Add cosine similarity weights
+        normal_graph = add_euclidean_distance_weights(normal_graph, trained_normal_embeddings)
+        impaired_graph = add_euclidean_distance_weights(impaired_graph, trained_impaired_embeddings)
+
+        # Print similarity matrices for debugging
+        normal_sim_matrix = 1 - pairwise_distances(trained_normal_embeddings, metric='cosine')
+        impaired_sim_matrix = 1 - pairwise_distances(trained_impaired_embeddings, metric='cosine')
+        print("Normal Similarity Matrix:\n", normal_sim_matrix)
+        print("Impaired Similarity Matrix:\n", impaired_sim_matrix)
+
+    # # Visualize embeddings
+    # visualize_embeddings(initial_normal_embeddings, "Initial Normal Embeddings")
+    # visualize_embeddings(trained_normal_embeddings, "Trained Normal Embeddings")
+    # visualize_embeddings(initial_impaired_embeddings, "Initial Impaired Embeddings")
+    # visualize_embeddings(trained_impaired_embeddings, "Trained Impaired Embeddings")
+
+    # Compare graphs
+    return compare_graphs_euclidean(normal_graph, impaired_graph, trained_normal_embeddings, trained_impaired_embeddings)
+
+def main(normal_file_path=None, impaired_file_path=None, edge_mode='dom', encoder_path=None, verbose=True):
+    configure_openai()
+
+    # Read HTML file content
+    normal_file_path = normal_file_path or os.path.join(os.path.dirname(__file__), 'output/visual_output.html')
+    impaired_file_path = impaired_file_path or os.path.join(os.path.dirname(__file__), 'output/impaired_output.html')
+
+    with open(normal_file_path, 'r', encoding='utf-8') as file:
+        normal_html_doc = file.read()
+
+    with open(impaired_file_path, 'r', encoding='utf-8') as file:
+        impaired_html_doc = file.read()
+
+    discrepancies = score_pages(normal_html_doc, impaired_html_doc, edge_mode=edge_mode, encoder_path=encoder_path, verbose=verbose)
+
+    # Print discrepancies
+    print("Discrepancies between normal and impaired graphs:")
+    for i, j, normal_sim, impaired_sim in zip(*discrepancies):
+        print(f"Nodes {i} and {j}: Normal similarity = {normal_sim:.2f}, Impaired similarity = {impaired_sim:.2f}")
+    return discrepancies
+
+
+if __name__ == "__main__":
+    main(edge_mode=os.getenv("A11METRIC_EDGE_MODE", "dom"), encoder_path=os.getenv("A11METRIC_ENCODER"))
@@ -1,62 +1,73 @@
 import os
 import networkx as nx
-from bs4 import BeautifulSoup
-import torch
-from torch_geometric.data import Data
-from torch_geometric.loader import DataLoader
-import openai
-from utils.graphsage import GraphSAGE
-from dotenv import load_dotenv
-from sklearn.manifold import TSNE
-import matplotlib.pyplot as plt
-from sklearn.metrics.pairwise import cosine_similarity, manhattan_distances
+from utils.embedding import embedding_matrix, get_ada_embeddings
+from utils.dom_graph import dom_edges, dom_paths, element_parents
+from utils.parsing import make_soup
+from utils.distance import iter_distance_blocks, mean_distances
+from utils.alignment import align_graphs
+from utils.config import configure_openai
 import numpy as np
 
-load_dotenv()
-
-api_key = os.getenv("OPENAI_API_KEY")
-openai.api_key = api_key
-
 # Function to get embeddings using OpenAI's ADA model
 def get_ada_embedding(text):
-    return openai.Embedding.create(input=[text], model='text-embedding-ada-002').data[0].embedding
+    return get_ada_embeddings([text])[0]
 
 # Function to convert HTML to a graph
-def convert_html_to_graph(html_doc):
-    soup = BeautifulSoup(html_doc, 'html.parser')
+def convert_html_to_graph(html_doc, siblings=False, aria_refs=False, parser=None):
+    soup = make_soup(html_doc, parser)
     graph = nx.Graph()
 
-    # Iterate over each element in the HTML document and add nodes to the graph
-    for element in soup.find_all():
-        node_id = f"{element.name}_{element.get('id', '')}_{element.get('class', '')}"
-        graph.add_node(node_id, tag_name=element.name, attrs=element.attrs, text=element.get_text(strip=True))
+    # One node per element, keyed by its position in document order; the DOM path (e.g.
+    # /html[1]/body[1]/div[2]) identifies the element across the visual and impaired views
+    elements = soup.find_all()
+    parents = element_parents(elements)
+    for i, (element, path) in enumerate(zip(elements, dom_paths(elements, parents))):
+        graph.add_node(i, tag_name=element.name, attrs=element.attrs, text=element.get_text(strip=True), path=path)
+
+    # Link nodes along the DOM tree, optionally with sibling and aria reference edges
+    attrs = [element.attrs for element in elements]
+    for src, dst, kind in dom_edges(parents, attrs, siblings=siblings, aria_refs=aria_refs):
+        graph.add_edge(src, dst, kind=kind)
     return graph
 
 # Function to generate node features using embeddings
-def generate_node_features(graph):
-    ada_embedding_size = 1536
-    zero_vector = [0] * ada_embedding_size
-
-    # Generate embeddings for each node based on its text content
+def generate_node_features(graph, dtype='float32'):
+    # Build the text content of each node, then embed them all in batches into one feature matrix
+    # (graph.graph['features'], a row per node in graph.nodes order; empty texts keep zero rows)
+    texts = []
     for node in graph.nodes:
         attrs = graph.nodes[node]['attrs']
         tag_name = graph.nodes[node]['tag_name']
-        text_content = f"{tag_name} " + " ".join(attrs.get('id', '')) + " " + " ".join(attrs.get('class', '')) + " " + graph.nodes[node]['text']
-        feature = get_ada_embedding(text_content) if text_content.strip() else zero_vector
-        graph.nodes[node]['feature'] = feature
+        # id is a plain string and class a list of names; joining the id as well would spell it out letter by letter
+        classes = attrs.get('class', [])
+        classes = classes.split() if isinstance(classes, str) else classes
+        text_content = f"{tag_name} {attrs.get('id', '')} " + " ".join(classes) + " " + graph.nodes[node]['text']
+        texts.append(text_content if text_content.strip() else '')
+
+    graph.graph['features'] = embedding_matrix(texts, dtype=dtype)
     return graph
 
 # Function to convert NetworkX graph to PyTorch Geometric graph
-def nx_to_torch_geometric(graph):
+def nx_to_torch_geometric(graph, edge_mode='dom'):
+    import torch
+    from torch_geometric.data import Data
+
     nodes = list(graph.nodes)
     node_mapping = {node: i for i, node in enumerate(nodes)}
 
-    # Define edges between nodes (this could be more sophisticated)
-    edges = [(node_mapping[src], node_mapping[dst]) for src in nodes for dst in nodes if src != dst]
-    edge_index = torch.tensor(edges, dtype=torch.long).t().contiguous()
+    # Define edges between nodes: DOM edges in both directions, or every ordered pair
+    if edge_mode == 'dom':
+        edges = [(node_mapping[src], node_mapping[dst]) for src, dst in graph.edges if src != dst]
+        edges += [(dst, src) for src, dst in edges]
+    elif edge_mode == 'complete':
+        edges = [(node_mapping[src], node_mapping[dst]) for src in nodes for dst in nodes if src != dst]
+    else:
+        raise ValueError("Unsupported edge mode")
+    edge_index = torch.tensor(edges, dtype=torch.long).reshape(-1, 2).t().contiguous()
 
     # Features for each node
-    features = torch.tensor([graph.nodes[node]['feature'] for node in nodes], dtype=torch.float)
+    # Share the float32 feature matrix with torch instead of converting nested lists
+    features = torch.from_numpy(np.asarray(graph.graph['features'], dtype=np.float32))
 
     num_nodes = len(nodes)
     train_mask = torch.zeros(num_nodes, dtype=torch.bool)
@@ -76,25 +87,25 @@ def nx_to_torch_geometric(graph):
     return data
 
 # Function to add distance-based edge weights to the graph
-def add_distance_weights(graph, embeddings, metric='manhattan'):
-    node_list = list(graph.nodes)
-    if metric == 'cosine':
-        dist_matrix = cosine_similarity(embeddings)
-    elif metric == 'manhattan':
-        dist_matrix = manhattan_distances(embeddings)
-    else:
+# (cosine similarity for 'cosine', manhattan distance for 'manhattan'), one block of distances at a time
+def add_distance_weights(graph, embeddings, metric='manhattan', block_size=1024):
+    if metric not in ('cosine', 'manhattan'):
         raise ValueError("Unsupported metric")
-
-    # Add edge weights based on the distance between node embeddings
-    for i, src in enumerate(node_list):
-        for j, dst in enumerate(node_list):
-            if i != j:
-                distance = dist_matrix[i, j]
-                graph.add_edge(src, dst, weight=distance)
+    node_list = list(graph.nodes)
+    # Distances are symmetric, so the upper triangle covers every undirected edge
+    for row_start, col_start, block in iter_distance_blocks(embeddings, metric, block_size, upper=True):
+        i, j = np.nonzero(np.triu(np.ones(block.shape, dtype=bool), k=row_start - col_start + 1))
+        weights = 1 - block[i, j] if metric == 'cosine' else block[i, j]
+        graph.add_weighted_edges_from(
+            (node_list[row_start + a], node_list[col_start + b], weight)
+            for a, b, weight in zip(i.tolist(), j.tolist(), weights.tolist())
+        )
     return graph
 
 # Function to calculate similarities between initial and trained embeddings
 def calculate_similarities(data, model):
+    from torch_geometric.loader import DataLoader
+
     loader = DataLoader([data], batch_size=1)
     model.eval()
     initial_embeddings = model(data.x, data.edge_index).detach().numpy()
@@ -105,31 +116,31 @@ def calculate_similarities(data, model):
     return initial_embeddings, trained_embeddings
 
 # Function to compare normal and impaired graphs based on node embeddings
-def compare_graphs(normal_graph, impaired_graph, normal_embeddings, impaired_embeddings, metric='manhattan'):
-    if metric == 'cosine':
-        normal_dist_matrix = cosine_similarity(normal_embeddings)
-        impaired_dist_matrix = cosine_similarity(impaired_embeddings)
-    elif metric == 'manhattan':
-        normal_dist_matrix = manhattan_distances(normal_embeddings)
-        impaired_dist_matrix = manhattan_distances(impaired_embeddings)
-    else:
+def compare_graphs(normal_graph, impaired_graph, normal_embeddings, impaired_embeddings, metric='manhattan', key='path'):
+    if metric not in ('cosine', 'manhattan'):
         raise ValueError("Unsupported metric")
 
-    discrepancies = []
-    
-    # Calculate the discrepancies between the graphs
-    for node in normal_graph.nodes:
-        if node in impaired_graph.nodes:
-            i = list(normal_graph.nodes).index(node)
-            j = list(impaired_graph.nodes).index(node)
-            normal_dist = normal_dist_matrix[i]
-            impaired_dist = impaired_dist_matrix[j]
-            discrepancies.append((node, np.mean(normal_dist), np.mean(impaired_dist)))
-    
+    # Match nodes once through a hash index on their key, by default the DOM path
+    alignment = align_graphs(normal_graph, impaired_graph, key=key)
+    if alignment.unmatched_normal or alignment.unmatched_impaired:
+        print(f"Unmatched nodes: {len(alignment.unmatched_normal)} normal, {len(alignment.unmatched_impaired)} impaired")
+
+    # Mean distance of every aligned node to all nodes of its graph
+    normal_means = mean_distances(normal_embeddings, alignment.normal_idx, metric=metric)
+    impaired_means = mean_distances(impaired_embeddings, alignment.impaired_idx, metric=metric)
+    if metric == 'cosine':
+        # Report mean cosine similarity, as before
+        normal_means = 1 - normal_means
+        impaired_means = 1 - impaired_means
+
+    discrepancies = list(zip(alignment.keys, normal_means.tolist(), impaired_means.tolist()))
     return discrepancies
 
 # Function to visualize embeddings using t-SNE
 def visualize_embeddings(embeddings, title):
+    from sklearn.manifold import TSNE
+    import matplotlib.pyplot as plt
+
     tsne_model = TSNE(n_components=2, perplexity=5, random_state=42)
     embeddings_2d = tsne_model.fit_transform(embeddings)
     plt.figure(figsize=(10, 10))
@@ -137,44 +148,67 @@ def visualize_embeddings(embeddings, title):
     plt.scatter(embeddings_2d[:, 0], embeddings_2d[:, 1], s=20)
     plt.show()
 
-# Read HTML file content
-normal_file_path = os.path.join(os.path.dirname(__file__), 'output', 'visual_output.html')
-impaired_file_path = os.path.join(os.path.dirname(__file__), 'output', 'impaired_output.html')
+# Function to run the full pipeline on a normal/impaired page pair and return the discrepancies
+def score_pages(normal_html_doc, impaired_html_doc, metric='manhattan', edge_mode='dom', encoder_path=None,
+                verbose=False):
+    from utils.graphsage import GraphSAGE
+
+    # Convert HTML to graph
+    normal_graph = convert_html_to_graph(normal_html_doc)
+    impaired_graph = convert_html_to_graph(impaired_html_doc)
 
-with open(normal_file_path, 'r', encoding='utf-8') as file:
-    normal_html_doc = file.read()
+    # Generate node features
+    normal_graph = generate_node_features(normal_graph)
+    impaired_graph = generate_node_features(impaired_graph)
 
-with open(impaired_file_path, 'r', encoding='utf-8') as file:
-    impaired_html_doc = file.read()
+    # Convert to PyTorch Geometric graph ('dom' edges, or 'complete' for the all-pairs graph)
+    normal_data = nx_to_torch_geometric(normal_graph, edge_mode=edge_mode)
+    impaired_data = nx_to_torch_geometric(impaired_graph, edge_mode=edge_mode)
 
-# Convert HTML to graph
-normal_graph = convert_html_to_graph(normal_html_doc)
-impaired_graph = convert_html_to_graph(impaired_html_doc)
+    # Calculate similarities: with a pretrained encoder (see train_encoder.py) only the forward pass runs
+    if encoder_path:
+        encoder = GraphSAGE.load(encoder_path, dim_in=normal_data.num_node_features)
+        trained_normal_embeddings = encoder.embed(normal_data)
+        trained_impaired_embeddings = encoder.embed(impaired_data)
+    else:
+        initial_normal_embeddings, trained_normal_embeddings = calculate_similarities(normal_data, GraphSAGE(dim_in=normal_data.num_node_features, dim_h=128, dim_out=128))
+        initial_impaired_embeddings, trained_impaired_embeddings = calculate_similarities(impaired_data, GraphSAGE(dim_in=impaired_data.num_node_features, dim_h=128, dim_out=128))
+
+    # Add distance weights: N^2/2 edges per graph that compare_graphs does not use, so only for inspection
+    if verbose:
+        normal_graph = add_distance_weights(normal_graph, trained_normal_embeddings, metric=metric)
+        impaired_graph = add_distance_weights(impaired_graph, trained_impaired_embeddings, metric=metric)
+
+    # # Visualize the trained embeddings
+    # visualize_embeddings(trained_normal_embeddings, "Trained Normal Embeddings")
+    # visualize_embeddings(trained_impaired_embeddings, "Trained Impaired Embeddings")
 
-# Generate node features
-normal_graph = generate_node_features(normal_graph)
-impaired_graph = generate_node_features(impaired_graph)
+    # Compare graphs and identify discrepancies
+    return compare_graphs(normal_graph, impaired_graph, trained_normal_embeddings, trained_impaired_embeddings, metric=metric)
 
-# Convert to PyTorch Geometric graph
-normal_data = nx_to_torch_geometric(normal_graph)
-impaired_data = nx_to_torch_geometric(impaired_graph)
+def main(normal_file_path=None, impaired_file_path=None, metric='manhattan', edge_mode='dom', encoder_path=None,
+         verbose=False):
+    configure_openai()
 
-# Calculate similarities
-initial_normal_embeddings, trained_normal_embeddings = calculate_similarities(normal_data, GraphSAGE(dim_in=normal_data.num_node_features, dim_h=128, dim_out=128))
-initial_impaired_embeddings, trained_impaired_embeddings = calculate_similarities(impaired_data, GraphSAGE(dim_in=impaired_data.num_node_features, dim_h=128, dim_out=128))
+    # Read HTML file content
+    normal_file_path = normal_file_path or os.path.join(os.path.dirname(__file__), 'output', 'visual_output.html')
+    impaired_file_path = impaired_file_path or os.path.join(os.path.dirname(__file__), 'output', 'impaired_output.html')
 
-# Add distance weights
-normal_graph = add_distance_weights(normal_graph, trained_normal_embeddings, metric='manhattan')
-impaired_graph = add_distance_weights(impaired_graph, trained_impaired_embeddings, metric='manhattan')
+    with open(normal_file_path, 'r', encoding='utf-8') as file:
+        normal_html_doc = file.read()
 
-# Compare graphs and identify discrepancies
-discrepancies = compare_graphs(normal_graph, impaired_graph, trained_normal_embeddings, trained_impaired_embeddings, metric='manhattan')
+    with open(impaired_file_path, 'r', encoding='utf-8') as file:
+        impaired_html_doc = file.read()
+
+    discrepancies = score_pages(normal_html_doc, impaired_html_doc, metric=metric, edge_mode=edge_mode,
+                                encoder_path=encoder_path, verbose=verbose)
+
+    # Print discrepancies
+    print(f"Discrepancies between normal and impaired graphs ({metric.capitalize()}):")
+    for node, normal_dist, impaired_dist in discrepancies:
+        print(f"Node {node}: Normal distance = {normal_dist:.2f}, Impaired distance = {impaired_dist:.2f}")
+    return discrepancies
 
-# Print discrepancies
-print("Discrepancies between normal and impaired graphs (Manhattan):")
-for node, normal_dist, impaired_dist in discrepancies:
-    print(f"Node {node}: Normal distance = {normal_dist:.2f}, Impaired distance = {impaired_dist:.2f}")
 
-# # Visualize the trained embeddings
-# visualize_embeddings(trained_normal_embeddings, "Trained Normal Embeddings")
-# visualize_embeddings(trained_impaired_embeddings, "Trained Impaired Embeddings")
+if __name__ == "__main__":
+    main(edge_mode=os.getenv("A11METRIC_EDGE_MODE", "dom"), encoder_path=os.getenv("A11METRIC_ENCODER"))
@@ -0,0 +1,152 @@
+"""
+Score many pages in parallel and stream one JSON result per page as each one finishes.
+
+Usage: python batch_score.py manifest.jsonl results.jsonl --encoder encoder.pt --workers 8
+
+Each manifest line is a JSON object with either "page" (an original HTML file, split
+into its visual and impaired views in memory) or "normal" and "impaired" (two HTML
+files), plus an optional "id". A plain line that is not JSON is taken as a page path.
+Set "stream": true on a page to parse it incrementally.
+
+Every worker process loads the embedding provider and the encoder once, in its
+initializer: the encoder is read from its checkpoint path there and reused for
+every page the worker scores. Workers run torch single-threaded so that processes
+do not compete for cores, and score with verbose=False so per-page output stays off
+the shared stdout. The embedding cache is the shared sqlite file, so a text embedded by one
+worker is reused by all of them.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Per-process state set up by init_worker
+_worker = {}
+
+
+# Function to read a manifest into a list of entries
+def read_manifest(path):
+    entries = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = {'page': line}
+            entry.setdefault('id', entry.get('page') or f"line-{number}")
+            entries.append(entry)
+    return entries
+
+
+# Function to set up a worker process: one provider, one encoder and one torch thread per process.
+# The encoder is loaded here, once per process, and score_entry reuses it instead of reloading the checkpoint
+def init_worker(encoder_path=None, embeddings=None, embedding_dim=None, parser=None, edge_mode='dom'):
+    import torch
+    from utils.config import configure_openai
+    from utils.embedding import get_embedding_provider, set_embedding_provider
+    from utils.graphsage import GraphSAGE
+    from utils.parsing import set_parser
+
+    torch.set_num_threads(1)
+    configure_openai()
+    if embeddings:
+        set_embedding_provider(embeddings, dim=embedding_dim)
+    if parser:
+        set_parser(parser)
+    _worker['encoder'] = GraphSAGE.load(encoder_path, dim_in=get_embedding_provider().dim) if encoder_path else None
+    _worker['edge_mode'] = edge_mode
+
+
+# Function to score one manifest entry in a worker process
+def score_entry(entry, max_pairs=100):
+    from a11metric import convert_html_file_to_graph, convert_html_to_graph, score_graphs
+    from utils.dom_graph import build_dom_graph
+    from utils.splitter import split_views
+
+    start = time.perf_counter()
+    result = {'id': entry['id']}
+    try:
+        if 'page' in entry and entry.get('stream'):
+            normal_graph = convert_html_file_to_graph(entry['page'], view='visual')
+            impaired_graph = convert_html_file_to_graph(entry['page'], view='impaired')
+        elif 'page' in entry:
+            with open(entry['page'], 'r', encoding='utf-8') as file:
+                views = split_views(file.read())
+            normal_graph = build_dom_graph(views.visual_records)
+            impaired_graph = build_dom_graph(views.impaired_records)
+        else:
+            with open(entry['normal'], 'r', encoding='utf-8') as file:
+                normal_graph = convert_html_to_graph(file.read())
+            with open(entry['impaired'], 'r', encoding='utf-8') as file:
+                impaired_graph = convert_html_to_graph(file.read())
+
+        # verbose=False also silences the training progress of pages scored without an encoder
+        discrepancies = score_graphs(normal_graph, impaired_graph, edge_mode=_worker.get('edge_mode', 'dom'),
+                                     verbose=False, encoder=_worker.get('encoder'))
+        result['nodes'] = [normal_graph.number_of_nodes(), impaired_graph.number_of_nodes()]
+        result['discrepancies'] = len(discrepancies.i)
+        result['pairs'] = [[int(i), int(j), float(normal), float(impaired)]
+                           for i, j, normal, impaired in zip(*discrepancies)][:max_pairs]
+    except Exception as error:
+        # One broken page must not stop the batch
+        result['error'] = f"{type(error).__name__}: {error}"
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+# Function to score every manifest entry across a process pool, yielding results as pages finish
+def iter_batch_scores(entries, workers=None, max_pairs=100, encoder_path=None, embeddings=None, embedding_dim=None,
+                      parser=None, edge_mode='dom'):
+    # Cores available to this process, which can be fewer than the machine's in a container
+    workers = workers or (len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()) or 1
+    initargs = (encoder_path, embeddings, embedding_dim, parser, edge_mode)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as executor:
+        # Keep a bounded window of pages in flight, so a 10k-page manifest is not all queued at once
+        pending = set()
+        for entry in entries:
+            pending.add(executor.submit(score_entry, entry, max_pairs))
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+# Function to run a batch and write the results as JSON lines, flushing after each page
+def batch_score(manifest_path, output_path, workers=None, max_pairs=100, **worker_options):
+    entries = read_manifest(manifest_path)
+    failed = 0
+    start = time.perf_counter()
+    with open(output_path, 'w', encoding='utf-8') as output:
+        for count, result in enumerate(iter_batch_scores(entries, workers=workers, max_pairs=max_pairs,
+                                                         **worker_options), 1):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            failed += 'error' in result
+            print(f"[{count}/{len(entries)}] {result['id']}: "
+                  f"{result.get('error') or str(result['discrepancies']) + ' discrepancies'}", file=sys.stderr)
+    print(f"Scored {len(entries) - failed} of {len(entries)} pages in {time.perf_counter() - start:.1f}s "
+          f"-> {output_path}", file=sys.stderr)
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score the pages of a manifest across a process pool.")
+    parser.add_argument("manifest", help="JSONL manifest (see module docstring)")
+    parser.add_argument("output", help="JSONL file for the results")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--encoder", default=None, help="pretrained encoder checkpoint shared by all workers")
+    parser.add_argument("--edge-mode", choices=["dom", "complete"], default="dom")
+    parser.add_argument("--max-pairs", type=int, default=100, help="discrepant node pairs kept per page")
+    args = parser.parse_args()
+
+    batch_score(args.manifest, args.output, workers=args.workers, max_pairs=args.max_pairs,
+                encoder_path=args.encoder, edge_mode=args.edge_mode)
@@ -0,0 +1,68 @@
+"""
+Discrepancy search benchmark: all-pairs blocks against the neighbour tree.
+
+    python benchmarks/bench_discrepancies.py
+    python benchmarks/bench_discrepancies.py --nodes 2000 20000 --dims 16 128 --metrics euclidean
+
+Synthetic pages are clustered embeddings (nodes that look alike, as repeated cards
+and links do) with a perturbed impaired copy. For every size, width and metric the
+two methods of utils.distance.find_discrepancies are timed, their pairs compared, and
+the method that method='auto' would pick is marked.
+"""
+import argparse
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np
+from utils.distance import auto_method, find_discrepancies
+
+# Normal thresholds that keep a few close neighbours per node on the synthetic pages
+THRESHOLDS = {'euclidean': lambda dims: 0.05 * np.sqrt(dims), 'manhattan': lambda dims: 0.05 * dims,
+              'cosine': lambda dims: 0.002}
+
+
+def synthetic_page(nodes, dims, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(nodes // 20, 1), dims))
+    normal = centers[rng.integers(0, len(centers), nodes)] + rng.normal(scale=0.02, size=(nodes, dims))
+    impaired = normal + rng.normal(scale=0.05, size=(nodes, dims))
+    return normal.astype(np.float32), impaired.astype(np.float32)
+
+
+def timed(normal, impaired, metric, method):
+    threshold = THRESHOLDS[metric](normal.shape[1])
+    start = time.perf_counter()
+    found = find_discrepancies(normal, impaired, metric=metric, normal_threshold=threshold,
+                               impaired_threshold=threshold / 2, method=method)
+    return time.perf_counter() - start, set(zip(found.i.tolist(), found.j.tolist()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', nargs='+', type=int, default=[1000, 5000, 20000])
+    parser.add_argument('--dims', nargs='+', type=int, default=[16, 128])
+    parser.add_argument('--metrics', nargs='+', default=['euclidean', 'manhattan', 'cosine'])
+    args = parser.parse_args()
+
+    # Import the tree once up front so its load time is not charged to the first run
+    import sklearn.neighbors  # noqa: F401
+
+    print(f"{'nodes':>7} {'dims':>5} {'metric':<10} {'pairs':>8} {'blocks':>9} {'tree':>9}  auto")
+    for nodes in args.nodes:
+        for dims in args.dims:
+            normal, impaired = synthetic_page(nodes, dims)
+            for metric in args.metrics:
+                blocks_time, blocks_pairs = timed(normal, impaired, metric, 'blocks')
+                tree_time, tree_pairs = timed(normal, impaired, metric, 'tree')
+                auto = auto_method(nodes, dims, metric)
+                status = '' if blocks_pairs == tree_pairs else '  PAIRS DIFFER'
+                print(f"{nodes:>7} {dims:>5} {metric:<10} {len(tree_pairs):>8} {blocks_time:>8.2f}s "
+                      f"{tree_time:>8.2f}s  {auto}{status}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Parser benchmark: parse time and graph agreement of each parser backend on the HTML fixtures.
+
+    python benchmarks/bench_parsers.py
+    python benchmarks/bench_parsers.py --parsers html.parser lxml --repeat 10
+    python benchmarks/bench_parsers.py --files input/detailed_example.html
+
+Each fixture is turned into node records (utils.dom_graph.node_records) with every
+installed backend, plus the streaming parser of utils.streaming. The html.parser
+records are the reference: a backend agrees on a file when it yields the same tags,
+paths, attributes and direct text, i.e. an identical graph. The last line names the
+fastest backend that agrees on every file.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.dom_graph import node_records
+from utils.parsing import DEFAULT_PARSER, available_parsers, make_soup
+from utils.streaming import iter_dom_events
+
+STREAMING = 'streaming'
+FIXTURES = [os.path.join('input', '*.html'), os.path.join('output', '*.html')]
+
+
+def parse_records(html_doc, backend):
+    if backend == STREAMING:
+        records = [value for kind, value in iter_dom_events([html_doc]) if kind == 'node']
+        return sorted(records, key=lambda record: record['id'])
+    return node_records(make_soup(html_doc, backend))
+
+
+def record_signature(records):
+    """What the graph builder uses from each record, in document order."""
+    return [(record['tag'], record['path'], record['text'], sorted(record['attrs'].items())) for record in records]
+
+
+def first_difference(reference, records):
+    for expected, actual in zip(reference, records):
+        if expected != actual:
+            return actual[1]
+    return None if len(reference) == len(records) else 'node count'
+
+
+def measure(html_doc, backend, repeat):
+    """Best-of-`repeat` parse time and the resulting node records."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = parse_records(html_doc, backend)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--parsers', nargs='+', default=available_parsers() + [STREAMING])
+    parser.add_argument('--files', nargs='+', default=None, help='HTML files (default: input/ and output/ fixtures)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    files = args.files or sorted(path for pattern in FIXTURES for path in glob.glob(os.path.join(REPO_ROOT, pattern)))
+    totals = {backend: 0.0 for backend in args.parsers}
+    agrees = {backend: True for backend in args.parsers}
+
+    print(f"{'file':<40} {'backend':<12} {'time':>10} {'nodes':>7}  graph")
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as file:
+            html_doc = file.read()
+        reference = record_signature(parse_records(html_doc, DEFAULT_PARSER))
+        for backend in args.parsers:
+            elapsed, records = measure(html_doc, backend, args.repeat)
+            difference = first_difference(reference, record_signature(records))
+            totals[backend] += elapsed
+            agrees[backend] = agrees[backend] and difference is None
+            status = 'identical' if difference is None else f'differs at {difference}'
+            name = os.path.relpath(path, REPO_ROOT)
+            print(f"{name:<40} {backend:<12} {elapsed * 1000:>7.2f} ms {len(records):>7}  {status}")
+
+    print()
+    for backend in args.parsers:
+        print(f"{backend:<12} total {totals[backend] * 1000:>8.2f} ms   {'identical' if agrees[backend] else 'differs'}")
+    candidates = [backend for backend in args.parsers if agrees[backend]]
+    if candidates:
+        print(f"Fastest backend with identical graphs: {min(candidates, key=totals.get)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Startup benchmark: import time of each pipeline subsystem, measured in fresh interpreters.
+
+    python benchmarks/bench_startup.py                        # print a table
+    python benchmarks/bench_startup.py --save startup.json    # record a baseline
+    python benchmarks/bench_startup.py --baseline startup.json --tolerance 0.5
+
+With --baseline the script exits with status 1 when a module got slower than the
+baseline by more than the tolerance (a fraction, default 50%) or started pulling in
+heavy dependencies that it did not load before.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Pipeline modules, followed by the heavy dependencies they should only load on demand
+SUBSYSTEMS = [
+    'cli', 'extract_html', 'a11metric', 'a11metric_maha', 'llm',
+    'utils.embedding', 'utils.dom_graph', 'utils.distance', 'utils.alignment', 'utils.graphsage',
+]
+HEAVY_MODULES = ['torch', 'torch_geometric', 'sklearn', 'matplotlib', 'openai']
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module, repeat=3):
+    """Best-of-`repeat` import time of `module` in a fresh interpreter, plus the heavy modules it loaded."""
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-c', MEASURE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=REPO_ROOT, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            return {'seconds': None, 'heavy': [], 'error': result.stderr.strip().splitlines()[-1]}
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        if best is None or sample['seconds'] < best['seconds']:
+            best = sample
+    return best
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions of `results` against `baseline`."""
+    regressions = []
+    for module, result in results.items():
+        previous = baseline.get(module)
+        if previous is None or result['seconds'] is None or previous['seconds'] is None:
+            continue
+        if result['seconds'] > previous['seconds'] * (1 + tolerance):
+            regressions.append(f"{module}: {previous['seconds']:.3f}s -> {result['seconds']:.3f}s")
+        new_heavy = sorted(set(result['heavy']) - set(previous['heavy']))
+        if new_heavy:
+            regressions.append(f"{module}: now imports {', '.join(new_heavy)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=SUBSYSTEMS + HEAVY_MODULES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        results[module] = result = measure(module, args.repeat)
+        if result['seconds'] is None:
+            print(f"{module:<20} failed: {result['error']}")
+        else:
+            heavy = ', '.join(result['heavy']) or '-'
+            print(f"{module:<20} {result['seconds'] * 1000:>8.1f} ms   heavy: {heavy}")
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
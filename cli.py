@@ -0,0 +1,300 @@
+"""
+Command line entry point for the A11metrics pipeline.
+
+    python cli.py extract input/detailed_example.html
+    python cli.py crawl --sitemap sitemap.xml --base-url http://localhost:8000/
+    python cli.py embed output/visual_output.html --output visual_features.npy
+    python cli.py score --metric manhattan
+    python cli.py suggest --tags h1 img button
+    python cli.py index output/crawl/*.html && python cli.py neighbors --page output/crawl/a.html --node 12
+    python cli.py batch manifest.jsonl results.jsonl --encoder encoder.pt
+    python cli.py --parser lxml score --page input/detailed_example.html
+    python cli.py score --page input/detailed_example.html --encoder encoder.pt --incremental
+
+Pipeline modules are imported inside each subcommand, so `--help` and extract-only
+runs do not pay for torch, openai or scikit-learn.
+"""
+import argparse
+import os
+
+
+def run_extract(args):
+    if args.url:
+        from extract_html_real_website import analyze_website_accessibility
+        analyze_website_accessibility(args.input, visual_output_path=args.visual, impaired_output_path=args.impaired)
+    else:
+        from extract_html import main as extract_main
+        extract_main(args.input, visual_output_path=args.visual, impaired_output_path=args.impaired)
+        print(f"Outputs saved:\n- Visual: {args.visual}\n- Impaired: {args.impaired}")
+
+
+def run_crawl(args):
+    from extract_html_real_website import crawl_website_accessibility
+    crawl_website_accessibility(args.urls, sitemap=args.sitemap, output_dir=args.output_dir, base_url=args.base_url,
+                                max_workers=args.workers, rate_limit=args.rate,
+                                **({'cache_path': None} if args.no_cache else {}))
+
+
+def run_embed(args):
+    import numpy as np
+    from a11metric import convert_html_to_graph, generate_node_features
+    from utils.config import configure_openai
+
+    configure_openai()
+    with open(args.input, 'r', encoding='utf-8') as file:
+        html_doc = file.read()
+    graph = generate_node_features(convert_html_to_graph(html_doc), dtype=args.dtype)
+    features = graph.graph['features']
+    np.save(args.output, features)
+    print(f"Saved {features.shape[0]} node features to {args.output}")
+
+
+def corpus_space(encoder_path):
+    from utils.embedding import get_embedding_provider
+    if encoder_path:
+        return f"encoder:{os.path.abspath(encoder_path)}:{os.path.getmtime(encoder_path)}"
+    provider = get_embedding_provider()
+    return f"features:{provider.name}:{provider.dim}"
+
+
+def run_index(args):
+    from a11metric import page_node_embeddings
+    from utils.config import configure_openai
+    from utils.corpus import DEFAULT_CORPUS_DIR, CorpusEmbeddingStore
+    from utils.embedding import get_embedding_provider
+    from utils.graphsage import GraphSAGE
+
+    configure_openai()
+    store = CorpusEmbeddingStore(args.corpus or DEFAULT_CORPUS_DIR, space=corpus_space(args.encoder))
+    encoder = GraphSAGE.load(args.encoder, dim_in=get_embedding_provider().dim) if args.encoder else None
+    for page in args.pages:
+        with open(page, 'r', encoding='utf-8') as file:
+            embedded = page_node_embeddings(file.read(), encoder=encoder)
+        # Pages are keyed by absolute path, so the same file given as a different relative path is not indexed twice
+        added = sum(len(store.add_page(os.path.abspath(page), records, embeddings, view=view))
+                    for view, (records, embeddings) in embedded.items() if view in args.views)
+        print(f"{page}: {added} nodes added" if added else f"{page}: already indexed")
+    print(f"Corpus {store.directory}: {len(store)} nodes")
+
+
+def run_neighbors(args):
+    from utils.config import configure_openai
+    from utils.corpus import DEFAULT_CORPUS_DIR, CorpusEmbeddingStore
+
+    configure_openai()
+    store = CorpusEmbeddingStore(args.corpus or DEFAULT_CORPUS_DIR)
+    if args.text is not None:
+        # The query text must be embedded exactly as the indexed nodes were
+        space = corpus_space(None)
+        if store.meta.get('space') != space:
+            raise SystemExit(f"--text queries are embedded as {space}, but the corpus holds "
+                             f"{store.meta.get('space') or 'no'} embeddings; select the provider it was indexed "
+                             f"with (--embeddings/--embedding-dim), or query by --page and --node")
+        from utils.embedding import embedding_matrix
+        vector, exclude = embedding_matrix([args.text]), None
+    elif args.page is None or args.node is None:
+        raise SystemExit("Give --page and --node of an indexed node, or --text")
+    else:
+        exclude = store.find(page=os.path.abspath(args.page), view=args.view, node=args.node)
+        if not len(exclude):
+            raise SystemExit(f"Node {args.node} of {args.page} ({args.view}) is not in the corpus")
+        vector = store.matrix()[exclude[0]]
+    for entry in store.nearest(vector, k=args.k, metric=args.metric, exclude=exclude):
+        print(f"{entry['distance']:.4f}  {entry['page']} [{entry['view']}] node {entry['node']} {entry['path']}  "
+              f"{entry['text'][:60]!r}")
+
+
+def run_score(args):
+    if args.page:
+        import a11metric
+        from utils.config import configure_openai
+
+        configure_openai()
+        if args.incremental:
+            if not args.encoder:
+                raise SystemExit("--incremental needs a pretrained --encoder")
+            with open(args.page, 'r', encoding='utf-8') as file:
+                html_content = file.read()
+            discrepancies = a11metric.score_page_incremental(html_content, os.path.abspath(args.page), args.encoder)
+        elif args.artifacts is not None:
+            from utils.artifacts import ArtifactStore
+            with open(args.page, 'r', encoding='utf-8') as file:
+                html_content = file.read()
+            store = ArtifactStore(args.artifacts) if args.artifacts else ArtifactStore()
+            discrepancies = a11metric.score_page_staged(html_content, store, edge_mode=args.edge_mode,
+                                                        encoder_path=args.encoder)
+        elif args.stream:
+            discrepancies = a11metric.score_page_file(args.page, edge_mode=args.edge_mode, encoder_path=args.encoder,
+                                                      verbose=args.verbose)
+        else:
+            with open(args.page, 'r', encoding='utf-8') as file:
+                html_content = file.read()
+            discrepancies = a11metric.score_page(html_content, edge_mode=args.edge_mode, encoder_path=args.encoder,
+                                                 verbose=args.verbose)
+        print("Discrepancies between normal and impaired graphs:")
+        for i, j, normal_dist, impaired_dist in zip(*discrepancies):
+            print(f"Nodes {i} and {j}: Normal distance = {normal_dist:.2f}, Impaired distance = {impaired_dist:.2f}")
+    elif args.metric == 'euclidean':
+        import a11metric
+        a11metric.main(args.normal, args.impaired, edge_mode=args.edge_mode, encoder_path=args.encoder,
+                       verbose=args.verbose)
+    else:
+        import a11metric_maha
+        a11metric_maha.main(args.normal, args.impaired, metric=args.metric, edge_mode=args.edge_mode,
+                            encoder_path=args.encoder, verbose=args.verbose)
+
+
+def run_suggest(args):
+    from llm import enhance_impaired_html
+    from utils.config import configure_openai
+    from utils.llm_executor import ChatExecutor
+
+    configure_openai()
+    executor = ChatExecutor(max_in_flight=args.concurrency, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    output_file_path = enhance_impaired_html(args.tags, visual_path=args.visual, impaired_path=args.impaired,
+                                             output_file_path=args.output, executor=executor)
+    print(f"Enhanced impaired HTML saved to {output_file_path}")
+
+
+def run_batch(args):
+    from batch_score import batch_score
+    batch_score(args.manifest, args.output, workers=args.workers, max_pairs=args.max_pairs, encoder_path=args.encoder,
+                embeddings=args.embeddings, embedding_dim=args.embedding_dim, parser=args.parser,
+                edge_mode=args.edge_mode)
+
+
+def run_train(args):
+    from train_encoder import train_encoder
+    from utils.config import configure_openai
+
+    configure_openai()
+    html_docs = []
+    for page in args.pages:
+        with open(page, 'r', encoding='utf-8') as file:
+            html_docs.append(file.read())
+    encoder = train_encoder(html_docs, epochs=args.epochs, patience=args.patience, batch_size=args.batch_size,
+                            num_workers=args.workers, max_nodes=args.max_nodes)
+    encoder.save(args.checkpoint)
+    print(f"Encoder saved to {args.checkpoint}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="a11metrics", description="Graph-based accessibility metric for HTML pages.")
+    parser.add_argument("--parser", choices=["html.parser", "lxml", "html5lib"], default=None,
+                        help="HTML parser backend (default: $A11METRIC_PARSER or html.parser)")
+    parser.add_argument("--embeddings", choices=["openai", "hashing"], default=None,
+                        help="node embedding backend (default: $A11METRIC_EMBEDDINGS or openai)")
+    parser.add_argument("--embedding-dim", type=int, default=None,
+                        help="dimensionality of the hashing backend (given by --embeddings or $A11METRIC_EMBEDDINGS)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    extract = subparsers.add_parser("extract", help="split a page into visual and impaired views")
+    extract.add_argument("input", help="HTML file (or URL with --url)")
+    extract.add_argument("--url", action="store_true", help="fetch the input as a web page")
+    extract.add_argument("--visual", default="output/visual_output.html")
+    extract.add_argument("--impaired", default="output/impaired_output.html")
+    extract.set_defaults(func=run_extract)
+
+    crawl = subparsers.add_parser("crawl", help="fetch many pages concurrently and split each one")
+    crawl.add_argument("urls", nargs="*", help="page URLs (relative ones are resolved against --base-url)")
+    crawl.add_argument("--sitemap", default=None, help="sitemap (or sitemap index) listing more pages")
+    crawl.add_argument("--base-url", default=None, help="e.g. http://localhost:8000/ for a local fixture server")
+    crawl.add_argument("--output-dir", default="output/crawl")
+    crawl.add_argument("--workers", type=int, default=8, help="concurrent requests")
+    crawl.add_argument("--rate", type=float, default=2.0, help="requests per second per host")
+    crawl.add_argument("--no-cache", action="store_true", help="skip the ETag/Last-Modified page cache")
+    crawl.set_defaults(func=run_crawl)
+
+    embed = subparsers.add_parser("embed", help="compute node features of a page")
+    embed.add_argument("input", help="HTML file")
+    embed.add_argument("--output", required=True, help=".npy file for the feature matrix")
+    embed.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    embed.set_defaults(func=run_embed)
+
+    score = subparsers.add_parser("score", help="compare a visual and an impaired page")
+    score.add_argument("--normal", default=None, help="visual HTML file (default: output/visual_output.html)")
+    score.add_argument("--impaired", default=None, help="impaired HTML file (default: output/impaired_output.html)")
+    score.add_argument("--page", default=None,
+                       help="original HTML file to split and score in memory (euclidean metric only)")
+    score.add_argument("--stream", action="store_true",
+                       help="parse --page incrementally, for very large pages")
+    score.add_argument("--incremental", action="store_true",
+                       help="with --page and --encoder: reuse the page's previous run and recompute only its edits")
+    score.add_argument("--artifacts", nargs="?", const="", default=None, metavar="DIR",
+                       help="with --page: save each stage's results (default .cache/artifacts) and resume from them")
+    score.add_argument("--metric", choices=["euclidean", "manhattan", "cosine"], default="euclidean")
+    score.add_argument("--edge-mode", choices=["dom", "complete"], default="dom")
+    score.add_argument("--encoder", default=None, help="pretrained encoder checkpoint (skips per-page training)")
+    score.add_argument("--verbose", action="store_true", help="print intermediate features and embeddings")
+    score.set_defaults(func=run_score)
+
+    suggest = subparsers.add_parser("suggest", help="ask the LLM to repair elements of the impaired page")
+    suggest.add_argument("--visual", default="output/visual_output.html")
+    suggest.add_argument("--impaired", default="output/impaired_output.html")
+    suggest.add_argument("--output", default="output/updated_impaired_output.html")
+    suggest.add_argument("--tags", nargs="+", default=['h1', 'h2', 'h3', 'p', 'img', 'a', 'button'])
+    suggest.add_argument("--concurrency", type=int, default=8, help="LLM requests in flight at once")
+    suggest.add_argument("--rpm", type=int, default=500, help="LLM requests per minute")
+    suggest.add_argument("--tpm", type=int, default=None, help="LLM tokens per minute")
+    suggest.set_defaults(func=run_suggest)
+
+    index = subparsers.add_parser("index", help="add the node embeddings of pages to the corpus store")
+    index.add_argument("pages", nargs="+", help="original HTML files")
+    index.add_argument("--corpus", default=None, help="corpus directory (default: .cache/corpus)")
+    index.add_argument("--encoder", default=None,
+                       help="shared pretrained encoder; without it the node features are indexed")
+    index.add_argument("--views", nargs="+", choices=["visual", "impaired"], default=["visual", "impaired"])
+    index.set_defaults(func=run_index)
+
+    neighbors = subparsers.add_parser("neighbors", help="find the nearest nodes across the indexed pages")
+    neighbors.add_argument("--corpus", default=None, help="corpus directory (default: .cache/corpus)")
+    neighbors.add_argument("--page", default=None, help="indexed page of the query node (any path to the same file)")
+    neighbors.add_argument("--node", type=int, default=None, help="node id of the query node")
+    neighbors.add_argument("--view", choices=["visual", "impaired"], default="visual")
+    neighbors.add_argument("--text", default=None, help="query by text instead (feature corpora only)")
+    neighbors.add_argument("-k", type=int, default=10)
+    neighbors.add_argument("--metric", choices=["euclidean", "manhattan", "cosine"], default="cosine")
+    neighbors.set_defaults(func=run_neighbors)
+
+    batch = subparsers.add_parser("batch", help="score the pages of a manifest across a process pool")
+    batch.add_argument("manifest", help="JSONL manifest of pages (see batch_score.py)")
+    batch.add_argument("output", help="JSONL file for the results, written as pages finish")
+    batch.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    batch.add_argument("--encoder", default=None, help="pretrained encoder checkpoint shared by all workers")
+    batch.add_argument("--edge-mode", choices=["dom", "complete"], default="dom")
+    batch.add_argument("--max-pairs", type=int, default=100, help="discrepant node pairs kept per page")
+    batch.set_defaults(func=run_batch)
+
+    train = subparsers.add_parser("train", help="train a reusable GraphSAGE encoder")
+    train.add_argument("checkpoint", help="where to save the trained encoder")
+    train.add_argument("pages", nargs="+", help="HTML files to train on")
+    train.add_argument("--epochs", type=int, default=100)
+    train.add_argument("--batch-size", type=int, default=32, help="pages per mini-batch")
+    train.add_argument("--workers", type=int, default=0, help="data-loading worker processes")
+    train.add_argument("--max-nodes", type=int, default=20000,
+                       help="pages with more nodes are trained with neighbor-sampled mini-batches")
+    train.add_argument("--patience", type=int, default=None)
+    train.set_defaults(func=run_train)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.embedding_dim is not None:
+        # Size the backend selected here or in the environment; the OpenAI model has a fixed size
+        args.embeddings = args.embeddings or os.getenv("A11METRIC_EMBEDDINGS", "openai")
+        if args.embeddings == 'openai':
+            parser.error("--embedding-dim only applies to the hashing backend; add --embeddings hashing")
+    if args.embeddings:
+        from utils.embedding import set_embedding_provider
+        set_embedding_provider(args.embeddings, dim=args.embedding_dim)
+    if args.parser:
+        from utils.parsing import set_parser
+        set_parser(args.parser)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
+import hashlib
 import os
+import re
+from urllib.parse import urlsplit
 import requests
-from bs4 import BeautifulSoup
-import copy
+from utils.crawler import DEFAULT_CACHE_PATH, Crawler
+from utils.splitter import split_views
 
 # Function to fetch HTML content from a website
-def fetch_website_html(url):
-    response = requests.get(url)
+def fetch_website_html(url, session=None, timeout=10):
+    response = (session or requests).get(url, timeout=timeout)
     if response.status_code == 200:
         print("Successfully fetched the webpage.")
         return response.text
@@ -15,46 +18,13 @@ def fetch_website_html(url):
 
 # Function to generate two HTML outputs
 def generate_accessible_html_outputs(html_content):
-    # Parse the HTML content
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
-    # Create a deep copy for the impaired output
-    impaired_soup = copy.deepcopy(soup)
-
-    # Expanded list of attributes to remove for visual output
-    accessibility_attrs = [
-        'aria-label', 'role', 'aria-labelledby', 'aria-describedby',
-        'aria-hidden', 'tabindex', 'alt', 'aria-controls', 'aria-expanded',
-        'aria-pressed', 'aria-selected', 'aria-live', 'aria-atomic', 
-        'aria-relevant', 'aria-busy', 'aria-disabled'
-    ]
-
-    # Process for visual output: Remove accessibility attributes
-    for tag in soup.find_all(True):
-        for attr in accessibility_attrs:
-            if attr in tag.attrs:
-                del tag[attr]
-        # Remove all classes, ids, and keep only the text information
-        tag.attrs = {k: v for k, v in tag.attrs.items() if k not in ['class', 'id']}
-
-    # Process for impaired output: Keep only accessibility information
-    for tag in impaired_soup.find_all(True):
-        # If the tag does not have any accessibility attributes, remove its text content
-        if not any(attr in tag.attrs for attr in accessibility_attrs):
-            for child in tag.find_all(string=True):
-                child.extract()  # This removes all text content from the tag
-        
-        # Only keep the accessibility attributes, remove everything else except tag structure
-        tag.attrs = {k: v for k, v in tag.attrs.items() if k in accessibility_attrs}
-    
-    # Convert both soups back to HTML strings
-    visual_output = soup.prettify()
-    impaired_output = impaired_soup.prettify()
-
-    return visual_output, impaired_output
+    # The visual output also drops classes and ids, keeping only the text information
+    views = split_views(html_content, visual_drop_attrs=('class', 'id'))
+    return views.visual_html, views.impaired_html
 
 # Main function to execute the full process
-def analyze_website_accessibility(url):
+def analyze_website_accessibility(url, visual_output_path='output/visual_real_website_output.html',
+                                  impaired_output_path='output/impaired_real_website_output.html'):
     # Step 1: Fetch the website's HTML content
     html_content = fetch_website_html(url)
     if html_content is None:
@@ -64,10 +34,8 @@ def analyze_website_accessibility(url):
     visual_output, impaired_output = generate_accessible_html_outputs(html_content)
 
     # Step 3: Save the outputs to HTML files
-    visual_output_path = 'output/visual_real_website_output.html'
-    impaired_output_path = 'output/impaired_real_website_output.html'
-
-    os.makedirs('output', exist_ok=True)  # Create the output directory if it doesn't exist
+    os.makedirs(os.path.dirname(visual_output_path) or '.', exist_ok=True)  # Create the output directory if it doesn't exist
+    os.makedirs(os.path.dirname(impaired_output_path) or '.', exist_ok=True)
 
     with open(visual_output_path, 'w') as file:
         file.write(visual_output)
@@ -76,8 +44,49 @@ def analyze_website_accessibility(url):
         file.write(impaired_output)
 
     print(f"Outputs saved:\n- Visual: {visual_output_path}\n- Impaired: {impaired_output_path}")
+    return visual_output_path, impaired_output_path
+
+# Function to name the output files of a crawled page after its URL
+def page_slug(url):
+    parts = urlsplit(url)
+    name = re.sub(r'[^A-Za-z0-9]+', '_', f"{parts.netloc}{parts.path}").strip('_')[:80]
+    # The hash keeps pages that differ only in their query string apart
+    return f"{name}_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}"
+
+# Function to crawl a list of pages (and/or a sitemap) and split each one into its two outputs
+def crawl_website_accessibility(urls=(), sitemap=None, output_dir='output/crawl', base_url=None,
+                                max_workers=8, rate_limit=2.0, cache_path=DEFAULT_CACHE_PATH):
+    crawler = Crawler(base_url=base_url, max_workers=max_workers, rate_limit=rate_limit, cache_path=cache_path)
+    try:
+        urls = list(urls)
+        if sitemap:
+            urls.extend(crawler.sitemap_urls(sitemap))
+
+        os.makedirs(output_dir, exist_ok=True)
+        outputs = []
+        for result in crawler.crawl(urls):
+            if result.html is None:
+                print(f"Failed to fetch {result.url}. Status code: {result.status}"
+                      + (f" ({result.error})" if result.error else ""))
+                continue
+            visual_output, impaired_output = generate_accessible_html_outputs(result.html)
+            slug = page_slug(result.url)
+            visual_output_path = os.path.join(output_dir, f"{slug}_visual.html")
+            impaired_output_path = os.path.join(output_dir, f"{slug}_impaired.html")
+            with open(visual_output_path, 'w') as file:
+                file.write(visual_output)
+            with open(impaired_output_path, 'w') as file:
+                file.write(impaired_output)
+            outputs.append((result.url, visual_output_path, impaired_output_path))
+    finally:
+        crawler.close()
+
+    print(f"Split {len(outputs)} of {len(urls)} pages into {output_dir}")
+    return outputs
+
+if __name__ == "__main__":
+    # Example usage
+    # website_url = 'https://gist.github.com/'
+    website_url = 'https://docs.stripe.com/'
+    analyze_website_accessibility(website_url)
 
-# Example usage
-# website_url = 'https://gist.github.com/'
-website_url = 'https://docs.stripe.com/'
-analyze_website_accessibility(website_url)
@@ -1,9 +1,22 @@
 import openai
-from bs4 import BeautifulSoup
-
-def generate_accessibility_html(visual_element_html, impaired_element_html):
+from utils.config import configure_openai
+from utils.parsing import make_soup
+from utils.dom_graph import dom_paths
+from utils.llm_executor import ChatExecutor
+from utils.prompt_cache import get_prompt_cache, normalize_html, prompt_key
+
+ACCESSIBILITY_MODEL = "gpt-4o"
+# Bump when the prompt in accessibility_request changes, so cached responses are not reused
+PROMPT_VERSION = 1
+
+# Function to compute the response cache key of an element pair
+def accessibility_cache_key(visual_element_html, impaired_element_html):
+    return prompt_key(ACCESSIBILITY_MODEL, PROMPT_VERSION,
+                      normalize_html(visual_element_html), normalize_html(impaired_element_html))
+
+def accessibility_request(visual_element_html, impaired_element_html):
     """
-    Query the LLM to generate a fully accessible version of the impaired element.
+    Build the chat completion request asking for a fully accessible version of the impaired element.
     """
     prompt = f"""
     You are an expert in web accessibility. You are given two HTML elements. The first element is from a fully accessible webpage:
@@ -25,63 +38,123 @@ def generate_accessibility_html(visual_element_html, impaired_element_html):
 
     Output only the final enhanced HTML element without any additional explanations, comments, or code formatting (like ```html). The output should be pure HTML code, without including the src attribute or any other attributes irrelevant to accessibility.
     """
-    response = openai.ChatCompletion.create(
-        model="gpt-4o",
-        messages=[
+    return {
+        "model": ACCESSIBILITY_MODEL,
+        "messages": [
             {"role": "system", "content": "You are an expert in web accessibility."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=300
-    )
+        "max_tokens": 300
+    }
+
+def generate_accessibility_html(visual_element_html, impaired_element_html):
+    """
+    Query the LLM to generate a fully accessible version of the impaired element.
+    Responses are cached per element pair.
+    """
+    cache = get_prompt_cache()
+    key = accessibility_cache_key(visual_element_html, impaired_element_html)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached.decode('utf-8')
+
+    response = openai.ChatCompletion.create(**accessibility_request(visual_element_html, impaired_element_html))
     enhanced_html = response.choices[0].message['content'].strip()
+    cache.set(key, enhanced_html.encode('utf-8'))
 
     return enhanced_html
 
-def enhance_impaired_html(tags_to_check):
+# Function to parse an LLM suggestion into the fragment that replaces the impaired element
+def parse_enhanced_html(enhanced_html):
+    # Always html.parser here: lxml and html5lib would wrap the fragment in <html><body>
+    enhanced_soup = make_soup(enhanced_html, 'html.parser')
+
+    # Remove non-accessibility attributes like src
+    for img in enhanced_soup.find_all('img'):
+        if 'src' in img.attrs:
+            del img.attrs['src']
+    return enhanced_soup
+
+def enhance_impaired_html(tags_to_check, visual_path='output/visual_output.html',
+                          impaired_path='output/impaired_output.html',
+                          output_file_path='output/updated_impaired_output.html', executor=None, use_cache=True):
     # Load HTML files
-    with open('output/visual_output.html', 'r', encoding='utf-8') as file:
+    with open(visual_path, 'r', encoding='utf-8') as file:
         visual_html_doc = file.read()
 
-    with open('output/impaired_output.html', 'r', encoding='utf-8') as file:
+    with open(impaired_path, 'r', encoding='utf-8') as file:
         impaired_html_doc = file.read()
 
     # Parse HTML documents with BeautifulSoup
-    visual_soup = BeautifulSoup(visual_html_doc, 'html.parser')
-    impaired_soup = BeautifulSoup(impaired_html_doc, 'html.parser')
-
-    # Process each tag type
-    for tag in tags_to_check:
-        visual_elements = visual_soup.find_all(tag)
-        impaired_elements = impaired_soup.find_all(tag)
-
-        # Ensure we only process the number of elements that exist in both documents
-        for idx in range(min(len(visual_elements), len(impaired_elements))):
-            impaired_element = impaired_elements[idx]
-            visual_element_html = str(visual_elements[idx])
-
-            if not impaired_element.get_text(strip=True):  # Check if the content is missing
-                impaired_element_html = str(impaired_element)
-
-                # Generate the enhanced HTML for the impaired element
-                enhanced_html = generate_accessibility_html(visual_element_html, impaired_element_html)
-
-                # Replace the impaired element with the enhanced version
-                enhanced_soup = BeautifulSoup(enhanced_html, 'html.parser')
-
-                # Remove non-accessibility attributes like src
-                for img in enhanced_soup.find_all('img'):
-                    if 'src' in img.attrs:
-                        del img.attrs['src']
-
-                impaired_element.replace_with(enhanced_soup)
+    visual_soup = make_soup(visual_html_doc)
+    impaired_soup = make_soup(impaired_html_doc)
+
+    # Index the visual document by (DOM path, tag) in one traversal; the views share their structure,
+    # so an impaired element is paired with the visual element at the same path
+    visual_elements = visual_soup.find_all()
+    visual_index = {(path, element.name): element for element, path in zip(visual_elements, dom_paths(visual_elements))}
+
+    # Collect every element that needs a suggestion first, in document order, so the requests can run concurrently
+    tags_to_check = set(tags_to_check)
+    impaired_elements = impaired_soup.find_all()
+    jobs = []
+    replaced = set()
+    for impaired_element, path in zip(impaired_elements, dom_paths(impaired_elements)):
+        if impaired_element.name not in tags_to_check:
+            continue
+        visual_element = visual_index.get((path, impaired_element.name))
+        if visual_element is None:  # No structural counterpart in the visual page
+            continue
+        # Skip elements nested in another replaced element, whose replacement would be discarded
+        if any(id(parent) in replaced for parent in impaired_element.parents):
+            continue
+        if not impaired_element.get_text(strip=True):  # Check if the content is missing
+            jobs.append((impaired_element, str(visual_element)))
+            replaced.add(id(impaired_element))
+
+    # Reuse cached responses; only element pairs that are new or changed go to the LLM
+    keys = [accessibility_cache_key(visual_element_html, str(impaired_element))
+            for impaired_element, visual_element_html in jobs]
+    cache = get_prompt_cache() if use_cache else None
+    responses = {}
+    if cache is not None:
+        responses = {key: value.decode('utf-8') for key, value in cache.get_many(keys).items()}
+    missing = list(dict.fromkeys(key for key in keys if key not in responses))
+
+    # Generate the enhanced HTML for the remaining elements, with bounded concurrency and rate limits
+    requests = {key: accessibility_request(visual_element_html, str(impaired_element))
+                for key, (impaired_element, visual_element_html) in zip(keys, jobs)}
+    executor = executor or ChatExecutor()
+
+    # Store each response as soon as it arrives, so an interrupted run keeps what was already paid for
+    def store_response(index, value):
+        if cache is not None and value is not None:
+            cache.set(missing[index], value.encode('utf-8'))
+
+    generated = dict(zip(missing, executor.run((requests[key] for key in missing), on_result=store_response)))
+    if cache is not None:
+        print(f"LLM response cache: {len(jobs) - len(missing)} of {len(jobs)} elements reused")
+    responses.update(generated)
+    results = [responses[key] for key in keys]
+
+    # Replace the impaired elements with the enhanced versions, in document order
+    for (impaired_element, _), enhanced_html in zip(jobs, results):
+        if enhanced_html is not None:
+            impaired_element.replace_with(parse_enhanced_html(enhanced_html))
 
     # Save the updated impaired HTML document
-    output_file_path = 'output/updated_impaired_output.html'
     with open(output_file_path, 'w', encoding='utf-8') as file:
         file.write(str(impaired_soup))
 
+    return output_file_path
+
 # List of tags to check for accessibility enhancements
-tags_to_check = ['h1', 'h2', 'h3', 'p', 'img', 'a', 'button']
+DEFAULT_TAGS_TO_CHECK = ['h1', 'h2', 'h3', 'p', 'img', 'a', 'button']
+
+
+if __name__ == "__main__":
+    configure_openai()
+
+    # Process the HTML files
+    enhance_impaired_html(DEFAULT_TAGS_TO_CHECK)
 
-# Process the HTML files
-enhance_impaired_html(tags_to_check)
@@ -1,12 +1,15 @@
 import os
+import sys
 import openai
 from bs4 import BeautifulSoup, Comment
 from dotenv import load_dotenv
 
-load_dotenv()
+# The script runs from this folder; make the repo's utils package importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.prompt_cache import get_prompt_cache, prompt_key
 
-api_key = os.getenv("OPENAI_API_KEY")
-openai.api_key = api_key
+# Bump when the suggestion prompt changes, so cached responses are not reused
+PROMPT_VERSION = 1
 
 def identify_impacted_nodes(discrepancies, threshold=5.0):
     impacted_nodes = [node for node, normal_dist, impaired_dist in discrepancies if impaired_dist - normal_dist > threshold]
@@ -14,6 +17,12 @@ def identify_impacted_nodes(discrepancies, threshold=5.0):
 
 def generate_accessibility_suggestions(node_name):
     prompt = f"The HTML node <{node_name}> has shown significant changes in its attributes or position, affecting accessibility for visually impaired users. Suggest improvements to enhance its accessibility.The improvement should given the fixed node, should be in the form of an alt attribute for the image tag."
+    cache = get_prompt_cache()
+    key = prompt_key("gpt-4", PROMPT_VERSION, prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached.decode('utf-8')
+
     response = openai.ChatCompletion.create(
         model="gpt-4",
         messages=[
@@ -23,6 +32,7 @@ def generate_accessibility_suggestions(node_name):
         max_tokens=100
     )
     suggestions = response.choices[0].message['content'].strip()
+    cache.set(key, suggestions.encode('utf-8'))
     return suggestions
 
 
@@ -57,63 +67,73 @@ def apply_suggestions_to_html(html_doc, suggestions, output_file_path):
     with open(output_file_path, 'w', encoding='utf-8') as file:
         file.write(str(soup))
 
-# Example discrepancies output
-discrepancies = [
-    ("address_contact_", 2.18, 20.73),
-    ("img_", 1.5, 15.8),  # Added discrepancy for img to demonstrate alt text addition
-]
-
-# Identify impacted nodes
-impacted_nodes = identify_impacted_nodes(discrepancies)
-
-# Generate suggestions
-suggestions = {}
-for node in impacted_nodes:
-    suggestion = generate_accessibility_suggestions(node)
-    suggestions[node] = suggestion
-
-# Print suggestions
-for node, suggestion in suggestions.items():
-    print(f"Node: {node}\nSuggestion: {suggestion}\n")
-
-# More problematic impaired HTML document
-impaired_html_doc = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Sample Impaired Document</title>
-    <style>
-        body { font-size: small; }
-        h1 { color: red; }
-    </style>
-</head>
-<body>
-    <header>
-        <h1>Welcome</h1>
-    </header>
-    <main id="main_content">
-        <section>
-            <h2>About</h2>
-            <p>This is a sample website with minimal information.</p>
-            <img src="animals.jpg">
-        </section>
-    </main>
-    <footer>
-        <address id="contact">
-            <p>Contact us at info@example.com</p>
-        </address>
-    </footer>
-</body>
-</html>
-"""
-
-# Apply the suggestions to the HTML
-output_file_path = 'enhanced_document.html'
-apply_suggestions_to_html(impaired_html_doc, suggestions, output_file_path)
-
-# Print the enhanced HTML
-with open(output_file_path, 'r', encoding='utf-8') as file:
-    enhanced_html_doc = file.read()
-
-# print("-------- Enhanced HTML Document --------")
-# print(enhanced_html_doc)
+def main():
+    load_dotenv()
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    openai.api_key = api_key
+
+    # Example discrepancies output
+    discrepancies = [
+        ("address_contact_", 2.18, 20.73),
+        ("img_", 1.5, 15.8),  # Added discrepancy for img to demonstrate alt text addition
+    ]
+
+    # Identify impacted nodes
+    impacted_nodes = identify_impacted_nodes(discrepancies)
+
+    # Generate suggestions
+    suggestions = {}
+    for node in impacted_nodes:
+        suggestion = generate_accessibility_suggestions(node)
+        suggestions[node] = suggestion
+
+    # Print suggestions
+    for node, suggestion in suggestions.items():
+        print(f"Node: {node}\nSuggestion: {suggestion}\n")
+
+    # More problematic impaired HTML document
+    impaired_html_doc = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Sample Impaired Document</title>
+        <style>
+            body { font-size: small; }
+            h1 { color: red; }
+        </style>
+    </head>
+    <body>
+        <header>
+            <h1>Welcome</h1>
+        </header>
+        <main id="main_content">
+            <section>
+                <h2>About</h2>
+                <p>This is a sample website with minimal information.</p>
+                <img src="animals.jpg">
+            </section>
+        </main>
+        <footer>
+            <address id="contact">
+                <p>Contact us at info@example.com</p>
+            </address>
+        </footer>
+    </body>
+    </html>
+    """
+
+    # Apply the suggestions to the HTML
+    output_file_path = 'enhanced_document.html'
+    apply_suggestions_to_html(impaired_html_doc, suggestions, output_file_path)
+
+    # Print the enhanced HTML
+    with open(output_file_path, 'r', encoding='utf-8') as file:
+        enhanced_html_doc = file.read()
+
+    # print("-------- Enhanced HTML Document --------")
+    # print(enhanced_html_doc)
+
+
+if __name__ == "__main__":
+    main()
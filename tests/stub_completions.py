@@ -0,0 +1,98 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, on aiohttp.
+
+    python tests/stub_completions.py --port 8766
+    OPENAI_API_BASE=http://127.0.0.1:8766/v1 python cli.py suggest
+
+The reply depends on the last message of a request:
+- "429 <n>" answers 429 with Retry-After: <n> the first time, then succeeds
+- "5xx <status>" answers that status the first time, then succeeds
+- "400" always answers 400
+- an accessibility prompt gets its impaired element back with an aria-label taken
+  from the visual element's text
+- anything else is echoed back
+"delay <seconds>" anywhere in the message holds the reply back that long.
+"""
+import argparse
+import asyncio
+import re
+import threading
+from collections import Counter
+
+from aiohttp import web
+
+
+def error(status, message, headers=None):
+    return web.json_response({'error': {'message': message, 'type': 'stub_error'}}, status=status, headers=headers)
+
+
+def suggestion(prompt):
+    # The accessibility prompt holds "Visual Element:" and "Impaired Element:" sections
+    visual = prompt.split('Visual Element:')[1].split('The second element')[0]
+    impaired = prompt.split('Impaired Element:')[1].split('Your task')[0].strip()
+    tag = re.match(r'<(\w+)', impaired).group(1)
+    label = re.sub(r'<[^>]*>', '', visual).strip() or re.search(r'alt="([^"]*)"', visual).group(1)
+    return f'<{tag} aria-label="{label}">{label}</{tag}>'
+
+
+class CompletionStub:
+    """The stub server, run on its own event loop in a background thread; calls counts requests per message."""
+    def __init__(self, port=0):
+        self.port = port
+        self.calls = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.complete)
+        return app
+
+    async def complete(self, request):
+        body = await request.json()
+        content = body['messages'][-1]['content']
+        self.calls[content] += 1
+        first = self.calls[content] == 1
+        command = content.split()
+        if command[0] == '429' and first:
+            return error(429, 'slow down', {'Retry-After': command[1]})
+        if command[0] == '5xx' and first:
+            return error(int(command[1]), 'server error')
+        if command[0] == '400':
+            return error(400, 'bad request')
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        delay = re.search(r'delay ([\d.]+)', content)
+        await asyncio.sleep(float(delay.group(1)) if delay else 0)
+        self.in_flight -= 1
+        reply = suggestion(content) if 'Impaired Element:' in content else content
+        return web.json_response({
+            'id': 'stub', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+        })
+
+    def start(self):
+        """Serve in a background thread; returns the api_base to point the client at."""
+        self.loop = asyncio.new_event_loop()
+        self.runner = web.AppRunner(self.app())
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', self.port)
+        self.loop.run_until_complete(site.start())
+        self.port = self.runner.addresses[0][1]
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+    web.run_app(CompletionStub(args.port).app(), host='127.0.0.1', port=args.port)
@@ -0,0 +1,115 @@
+import base64
+import io
+import json
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.alt_text import AltTextGenerator, prepare_image
+
+Image = pytest.importorskip('PIL.Image')
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'image')
+LARGE_IMAGE = os.path.join(IMAGE_DIR, 'content-image2.jpg')
+SMALL_IMAGE = os.path.join(IMAGE_DIR, 'intro-image.jpg')
+
+
+class VisionStub(BaseHTTPRequestHandler):
+    """Stand-in for the vision chat endpoint: describes an image by its size, and rejects data it cannot decode."""
+    sizes = []
+
+    def do_POST(self):
+        body = json.loads(self.read_chunked())
+        url = body['messages'][0]['content'][1]['image_url']['url']
+        try:
+            image = Image.open(io.BytesIO(base64.b64decode(url.split(',', 1)[1])))
+        except OSError:
+            return self.reply(400, {'error': {'message': 'invalid image'}})
+        self.sizes.append(image.size)
+        self.reply(200, {'choices': [{'message': {'content': f"image {image.size[0]}x{image.size[1]}"}}]})
+
+    def read_chunked(self):
+        # The generator streams its body, so it arrives with chunked transfer encoding
+        data = b''
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            data += self.rfile.read(size)
+            self.rfile.readline()
+            if not size:
+                return data
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api_base():
+    VisionStub.sizes = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), VisionStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def make_generator(api_base, tmp_path, **settings):
+    return AltTextGenerator(api_base=api_base, api_key='test-key', cache_path=str(tmp_path / 'alt_text.sqlite'),
+                            retries=0, **settings)
+
+
+def test_identical_images_are_described_once(api_base, tmp_path):
+    copy = str(tmp_path / 'renamed-logo.jpg')
+    shutil.copyfile(SMALL_IMAGE, copy)
+    descriptions = make_generator(api_base, tmp_path).describe_many([SMALL_IMAGE, copy, LARGE_IMAGE])
+
+    assert len(VisionStub.sizes) == 2
+    assert descriptions[SMALL_IMAGE] == descriptions[copy] == "image 300x168"
+    assert descriptions[LARGE_IMAGE] == "image 1024x768"
+
+
+def test_cache_is_keyed_on_the_preprocessing_settings(api_base, tmp_path):
+    make_generator(api_base, tmp_path).describe(LARGE_IMAGE)
+    make_generator(api_base, tmp_path).describe(LARGE_IMAGE)
+    assert len(VisionStub.sizes) == 1
+
+    # Another quality or size limit sends different pixels, so the cached text is not reused
+    make_generator(api_base, tmp_path, quality=50).describe(LARGE_IMAGE)
+    make_generator(api_base, tmp_path, max_bytes=1 << 21).describe(LARGE_IMAGE)
+    assert len(VisionStub.sizes) == 3
+
+
+def test_prepare_image_downscales_and_reencodes():
+    image_file, mime = prepare_image(LARGE_IMAGE, max_side=512, quality=70)
+    data = image_file.read()
+
+    assert mime == 'image/jpeg'
+    assert len(data) < os.path.getsize(LARGE_IMAGE)
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.size == (512, 384) and image.format == 'JPEG'
+
+
+def test_prepare_image_sends_small_images_unchanged():
+    image_file, mime = prepare_image(SMALL_IMAGE, max_side=512)
+    with image_file, open(SMALL_IMAGE, 'rb') as original:
+        assert (image_file.read(), mime) == (original.read(), 'image/jpeg')
+
+
+def test_unreadable_images_do_not_lose_the_batch(api_base, tmp_path):
+    broken = tmp_path / 'broken.jpg'
+    broken.write_bytes(b'not an image')
+    missing = str(tmp_path / 'missing.png')
+    descriptions = make_generator(api_base, tmp_path).describe_many([str(broken), SMALL_IMAGE, missing])
+
+    assert descriptions == {str(broken): None, SMALL_IMAGE: "image 300x168", missing: None}
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from utils.corpus import CorpusEmbeddingStore
+
+
+def records(count):
+    return [{'id': i, 'tag': 'p', 'path': f"/html[1]/body[1]/p[{i + 1}]", 'text': f"paragraph {i}"}
+            for i in range(count)]
+
+
+def test_rejected_page_is_not_recorded(tmp_path):
+    store = CorpusEmbeddingStore(str(tmp_path), dim=4)
+    with pytest.raises(ValueError):
+        store.add_page('/site/a.html', records(3), np.ones((3, 8)))
+    assert store.meta['pages'] == [] and len(store) == 0
+
+    # The page can still be added once its embeddings are valid, also after reopening the store
+    store = CorpusEmbeddingStore(str(tmp_path))
+    assert list(store.add_page('/site/a.html', records(3), np.ones((3, 4)))) == [0, 1, 2]
+    assert len(store.add_page('/site/a.html', records(3), np.ones((3, 4)))) == 0
+    assert CorpusEmbeddingStore(str(tmp_path)).meta['pages'] == ['/site/a.html#visual']
+
+
+def test_nearest_finds_the_closest_rows(tmp_path):
+    store = CorpusEmbeddingStore(str(tmp_path))
+    embeddings = np.eye(4, dtype=np.float32)
+    embeddings[3] = [0.9, 0.1, 0, 0]
+    store.add_page('/site/a.html', records(4), embeddings)
+
+    nearest = store.nearest(embeddings[0], k=2, metric='euclidean', exclude=[0])
+    assert [entry['node'] for entry in nearest] == [3, 1]
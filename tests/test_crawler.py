@@ -0,0 +1,131 @@
+import socket
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.crawler import Crawler, make_session, parse_sitemap
+
+SITEMAP_INDEX = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>/sitemap-a.xml</loc></sitemap>
+  <sitemap><loc>/sitemap-b.xml</loc></sitemap>
+</sitemapindex>"""
+
+SITEMAPS = {
+    '/sitemap-a.xml': ['/page-1', '/page-2'],
+    '/sitemap-b.xml': ['/page-3'],
+}
+
+
+def urlset(locations):
+    entries = ''.join(f"<url><loc>{location}</loc></url>" for location in locations)
+    return f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+
+
+class SiteStub(BaseHTTPRequestHandler):
+    """Small site: a sitemap index, pages with ETags, and URLs that fail a set number of times."""
+    hits = Counter()
+    failures = {}
+
+    def do_GET(self):
+        self.hits[self.path] += 1
+        if self.path == '/sitemap.xml':
+            return self.reply(200, SITEMAP_INDEX)
+        if self.path in SITEMAPS:
+            return self.reply(200, urlset(SITEMAPS[self.path]))
+        status = self.failures.get(self.path)
+        if status and self.hits[self.path] <= 2:
+            return self.reply(status, 'busy', {'Retry-After': '0'})
+        etag = f'"{self.path}-v1"'
+        if self.headers.get('If-None-Match') == etag:
+            return self.reply(304, '')
+        return self.reply(200, f"<html><body><h1>{self.path}</h1></body></html>", {'ETag': etag})
+
+    def reply(self, status, body, headers=None):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    SiteStub.hits = Counter()
+    SiteStub.failures = {}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SiteStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def make_crawler(base_url, tmp_path):
+    crawler = Crawler(base_url=base_url, max_workers=4, rate_limit=0, cache_path=str(tmp_path / 'http.sqlite'))
+    # Retry without backoff so the tests do not sleep
+    crawler.session = make_session(pool_size=4, retries=3, backoff=0)
+    return crawler
+
+
+def test_parse_sitemap_tells_an_index_from_a_urlset():
+    assert parse_sitemap(SITEMAP_INDEX) == (True, ['/sitemap-a.xml', '/sitemap-b.xml'])
+    assert parse_sitemap(urlset(['/page-1'])) == (False, ['/page-1'])
+
+
+def test_sitemap_index_is_followed_recursively(site, tmp_path):
+    crawler = make_crawler(site, tmp_path)
+    try:
+        assert crawler.sitemap_urls('/sitemap.xml') == ['/page-1', '/page-2', '/page-3']
+    finally:
+        crawler.close()
+
+
+def test_304_revalidation_returns_the_cached_html(site, tmp_path):
+    crawler = make_crawler(site, tmp_path)
+    try:
+        [first] = crawler.crawl(['/page-1'])
+        [second] = crawler.crawl(['/page-1'])
+    finally:
+        crawler.close()
+
+    assert (first.status, first.from_cache) == (200, False)
+    assert (second.status, second.from_cache) == (304, True)
+    assert second.html == first.html == "<html><body><h1>/page-1</h1></body></html>"
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_busy_responses_are_retried(site, tmp_path, status):
+    SiteStub.failures = {'/busy': status}
+    crawler = make_crawler(site, tmp_path)
+    try:
+        [result] = crawler.crawl(['/busy'])
+    finally:
+        crawler.close()
+
+    assert result.status == 200
+    assert SiteStub.hits['/busy'] == 3
+
+
+def test_failed_fetch_does_not_abort_the_crawl(site, tmp_path):
+    # Take a free port and close it again, so the connection is refused on every retry
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        unreachable = f"http://127.0.0.1:{probe.getsockname()[1]}/page"
+    crawler = make_crawler(site, tmp_path)
+    try:
+        results = {result.url: result for result in crawler.crawl([unreachable, '/page-1', '/page-2'])}
+    finally:
+        crawler.close()
+
+    assert results[unreachable].status is None
+    assert results[unreachable].html is None and results[unreachable].error
+    assert results[f"{site}/page-1"].status == 200
+    assert results[f"{site}/page-2"].status == 200
@@ -0,0 +1,93 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from utils.embedding import EmbeddingClient, embedding_matrix
+
+DIM = 4
+
+
+def fake_embedding(text):
+    return [float(len(text)), float(sum(text.encode('utf-8')) % 97), 1.0, 0.0]
+
+
+class EmbeddingStub(BaseHTTPRequestHandler):
+    """Stand-in for the OpenAI /embeddings endpoint; records the inputs of every request."""
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.requests.append(body['input'])
+        # Answer in reverse order, as the API does not promise input order
+        data = [{'object': 'embedding', 'index': i, 'embedding': fake_embedding(text)}
+                for i, text in reversed(list(enumerate(body['input'])))]
+        payload = json.dumps({'object': 'list', 'data': data, 'model': body['model']}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api_base(monkeypatch):
+    import openai
+
+    monkeypatch.setattr(openai, 'api_key', 'test-key')
+    EmbeddingStub.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), EmbeddingStub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(api_base, tmp_path):
+    return EmbeddingClient(api_base=api_base, cache_path=str(tmp_path / 'embeddings.sqlite'), dim=DIM)
+
+
+def test_duplicate_texts_are_sent_once(api_base, tmp_path):
+    matrix = make_client(api_base, tmp_path).embed(['a link', 'a button', 'a link', 'a link'])
+
+    assert EmbeddingStub.requests == [['a link', 'a button']]
+    assert matrix.shape == (4, DIM)
+    np.testing.assert_array_equal(matrix[0], fake_embedding('a link'))
+    np.testing.assert_array_equal(matrix[1], fake_embedding('a button'))
+    np.testing.assert_array_equal(matrix[3], matrix[0])
+
+
+def test_inputs_are_split_into_batches_of_256(api_base, tmp_path):
+    texts = [f"node {i}" for i in range(600)]
+    matrix = make_client(api_base, tmp_path).embed(texts)
+
+    assert [len(batch) for batch in EmbeddingStub.requests] == [256, 256, 88]
+    assert sum(EmbeddingStub.requests, []) == texts
+    np.testing.assert_array_equal(matrix[599], fake_embedding('node 599'))
+
+
+def test_second_call_is_served_from_the_disk_cache(api_base, tmp_path):
+    texts = ['heading', 'paragraph', 'image']
+    first = make_client(api_base, tmp_path).embed(texts)
+    assert len(EmbeddingStub.requests) == 1
+
+    # A new client on the same sqlite file finds every text without any HTTP request
+    EmbeddingStub.requests = []
+    second = make_client(api_base, tmp_path).embed(texts)
+    assert EmbeddingStub.requests == []
+    np.testing.assert_array_equal(first, second)
+
+
+def test_embedding_matrix_leaves_empty_texts_as_zero_rows(api_base, tmp_path):
+    matrix = embedding_matrix(['nav', '', 'footer', ''], provider=make_client(api_base, tmp_path))
+
+    assert EmbeddingStub.requests == [['nav', 'footer']]
+    assert matrix.dtype == np.float32
+    assert not matrix[1].any() and not matrix[3].any()
+    np.testing.assert_array_equal(matrix[2], fake_embedding('footer'))
@@ -0,0 +1,48 @@
+import pytest
+
+from llm import DEFAULT_TAGS_TO_CHECK, enhance_impaired_html
+from tests.stub_completions import CompletionStub
+from utils.llm_executor import ChatExecutor
+from utils.parsing import make_soup
+
+# The delays make the responses arrive in reverse document order
+VISUAL = """<html><body>
+<h1>Title delay 0.3</h1>
+<p>Intro delay 0.15</p>
+<a href="/home"><img src="logo.png" alt="Logo"/></a>
+<button>Send</button>
+</body></html>"""
+
+IMPAIRED = """<html><body>
+<h1></h1>
+<p></p>
+<a href="/home"><img src="logo.png"/></a>
+<button></button>
+</body></html>"""
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    import openai
+
+    monkeypatch.setattr(openai, 'api_key', 'test-key')
+    server = CompletionStub()
+    server.api_base = server.start()
+    yield server
+    server.stop()
+
+
+def test_replacements_follow_document_order_and_skip_nested_elements(stub, tmp_path):
+    (tmp_path / 'visual.html').write_text(VISUAL, encoding='utf-8')
+    (tmp_path / 'impaired.html').write_text(IMPAIRED, encoding='utf-8')
+    output = tmp_path / 'updated.html'
+
+    enhance_impaired_html(DEFAULT_TAGS_TO_CHECK, visual_path=str(tmp_path / 'visual.html'),
+                          impaired_path=str(tmp_path / 'impaired.html'), output_file_path=str(output),
+                          executor=ChatExecutor(api_base=stub.api_base), use_cache=False)
+
+    # The img inside the replaced link gets no request of its own
+    assert sum(stub.calls.values()) == 4
+    body = make_soup(output.read_text(encoding='utf-8')).body
+    assert [(element.name, element.get('aria-label')) for element in body.find_all()] == [
+        ('h1', 'Title delay 0.3'), ('p', 'Intro delay 0.15'), ('a', 'Logo'), ('button', 'Send')]
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from tests.stub_completions import CompletionStub
+from utils.llm_executor import ChatExecutor
+
+
+def chat(content):
+    return {'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': content}], 'max_tokens': 50}
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    import openai
+
+    monkeypatch.setattr(openai, 'api_key', 'test-key')
+    server = CompletionStub()
+    server.api_base = server.start()
+    yield server
+    server.stop()
+
+
+def test_429_waits_for_retry_after(stub):
+    # A 30 s backoff would stall the test; the 0.3 s Retry-After must be used instead
+    executor = ChatExecutor(api_base=stub.api_base, backoff=30)
+    start = time.monotonic()
+    assert executor.run([chat('429 0.3')]) == ['429 0.3']
+    assert 0.3 <= time.monotonic() - start < 5
+    assert stub.calls['429 0.3'] == 2
+
+
+@pytest.mark.parametrize('status', [500, 502, 503])
+def test_server_errors_are_retried(stub, status):
+    executor = ChatExecutor(api_base=stub.api_base, backoff=0.01)
+    content = f'5xx {status}'
+    assert executor.run([chat(content)]) == [content]
+    assert stub.calls[content] == 2
+
+
+def test_failed_request_keeps_the_other_responses(stub):
+    executor = ChatExecutor(api_base=stub.api_base, backoff=0.01, max_retries=2)
+    arrived = {}
+    results = executor.run([chat('first'), chat('400'), chat('5xx 500'), chat('last')],
+                           on_result=lambda index, text: arrived.update({index: text}))
+
+    assert results == ['first', None, '5xx 500', 'last']
+    assert arrived == dict(enumerate(results))
+    # A 400 is not retried
+    assert stub.calls['400'] == 1
+
+
+def test_requests_run_concurrently_up_to_max_in_flight(stub):
+    executor = ChatExecutor(api_base=stub.api_base, max_in_flight=3)
+    results = executor.run([chat(f'page {i} delay 0.2') for i in range(9)])
+
+    assert results == [f'page {i} delay 0.2' for i in range(9)]
+    assert stub.peak_in_flight == 3
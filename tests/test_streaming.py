@@ -0,0 +1,52 @@
+import glob
+import os
+
+import pytest
+
+from utils.dom_graph import build_dom_graph, node_records
+from utils.parsing import make_soup
+from utils.splitter import split_views
+from utils.streaming import graph_from_events, iter_dom_events
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = sorted(glob.glob(os.path.join(REPO_ROOT, 'input', '*.html')) +
+                  glob.glob(os.path.join(REPO_ROOT, 'output', '*.html')))
+
+
+def read(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def chunks(html, size=997):
+    # An odd chunk size splits tags and text across feed() calls
+    return [html[start:start + size] for start in range(0, len(html), size)]
+
+
+def edge_set(graph):
+    return {(min(src, dst), max(src, dst), kind) for src, dst, kind in graph.edges(data='kind')}
+
+
+def assert_same_graph(streamed, built):
+    assert list(streamed.nodes(data=True)) == list(built.nodes(data=True))
+    assert edge_set(streamed) == edge_set(built)
+
+
+@pytest.mark.parametrize('path', FIXTURES, ids=os.path.basename)
+@pytest.mark.parametrize('view', ['visual', 'impaired'])
+def test_streamed_views_match_split_views(path, view):
+    html = read(path)
+    views = split_views(html, parser='html.parser')
+    records = views.visual_records if view == 'visual' else views.impaired_records
+
+    built = build_dom_graph(records, siblings=True, aria_refs=True)
+    streamed = graph_from_events(iter_dom_events(chunks(html), siblings=True, aria_refs=True, view=view))
+    assert_same_graph(streamed, built)
+
+
+@pytest.mark.parametrize('path', FIXTURES, ids=os.path.basename)
+def test_streamed_page_matches_node_records(path):
+    html = read(path)
+    built = build_dom_graph(node_records(make_soup(html, 'html.parser')), siblings=True, aria_refs=True)
+    streamed = graph_from_events(iter_dom_events(chunks(html), siblings=True, aria_refs=True))
+    assert_same_graph(streamed, built)
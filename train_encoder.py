@@ -0,0 +1,51 @@
+"""
+Train one GraphSAGE encoder over many pages and save it as a checkpoint. The metric
+scripts load it when A11METRIC_ENCODER points to the checkpoint and then only run the
+forward pass, so embeddings are comparable across pages.
+
+Usage: python train_encoder.py encoder.pt output/visual_output.html output/impaired_output.html ...
+"""
+import argparse
+from a11metric import convert_html_to_graph, generate_node_features, nx_to_torch_geometric
+from utils.config import configure_openai
+from utils.graphsage import GraphSAGE, PageLoader
+from utils.embedding import get_embedding_provider
+
+# Function to turn a page into a PyTorch Geometric graph with DOM edges and embedding features
+def page_to_data(html_doc):
+    return nx_to_torch_geometric(generate_node_features(convert_html_to_graph(html_doc)))
+
+# Function to train one encoder over all pages, batching pages and neighbor-sampling oversized ones
+def train_encoder(html_docs, epochs=100, dim_h=128, dim_out=128, batch_size=32, num_workers=0, max_nodes=20000,
+                  patience=None):
+    datasets = [page_to_data(html_doc) for html_doc in html_docs]
+    model = GraphSAGE(dim_in=get_embedding_provider().dim, dim_h=dim_h, dim_out=dim_out)
+    loader = PageLoader(datasets, batch_size=batch_size, num_workers=num_workers, max_nodes=max_nodes)
+    model.fit(None, loader, epochs=epochs, patience=patience)
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a reusable GraphSAGE encoder on HTML pages.")
+    parser.add_argument("checkpoint", help="where to save the trained encoder")
+    parser.add_argument("pages", nargs="+", help="HTML files to train on")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32, help="pages per mini-batch")
+    parser.add_argument("--workers", type=int, default=0, help="data-loading worker processes")
+    parser.add_argument("--max-nodes", type=int, default=20000,
+                        help="pages with more nodes are trained with neighbor-sampled mini-batches")
+    parser.add_argument("--patience", type=int, default=None,
+                        help="stop after this many epochs without validation loss improvement")
+    args = parser.parse_args()
+
+    configure_openai()
+
+    html_docs = []
+    for page in args.pages:
+        with open(page, 'r', encoding='utf-8') as file:
+            html_docs.append(file.read())
+
+    encoder = train_encoder(html_docs, epochs=args.epochs, batch_size=args.batch_size,
+                            num_workers=args.workers, max_nodes=args.max_nodes, patience=args.patience)
+    encoder.save(args.checkpoint)
+    print(f"Encoder saved to {args.checkpoint}")
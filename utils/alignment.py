@@ -0,0 +1,44 @@
+from collections import namedtuple
+import numpy as np
+
+# Aligned node keys with their positions in each graph, plus the positions left unmatched
+Alignment = namedtuple('Alignment', ['keys', 'normal_idx', 'impaired_idx', 'unmatched_normal', 'unmatched_impaired'])
+
+
+def align_keys(normal_keys, impaired_keys):
+    """
+    Match two key sequences through a hash index on the key.
+
+    Keys that occur several times are paired in order of occurrence, so the n-th
+    normal node with a key is matched to the n-th impaired node with that key.
+    """
+    index = {}
+    for j, key in enumerate(impaired_keys):
+        index.setdefault(key, []).append(j)
+
+    keys, normal_idx, impaired_idx, unmatched_normal = [], [], [], []
+    used = {}
+    for i, key in enumerate(normal_keys):
+        candidates = index.get(key)
+        n = used.get(key, 0)
+        if candidates is None or n >= len(candidates):
+            unmatched_normal.append(i)
+            continue
+        used[key] = n + 1
+        keys.append(key)
+        normal_idx.append(i)
+        impaired_idx.append(candidates[n])
+
+    unmatched_impaired = [j for key, candidates in index.items() for j in candidates[used.get(key, 0):]]
+    unmatched_impaired.sort()
+    return Alignment(keys, np.array(normal_idx, dtype=np.int64), np.array(impaired_idx, dtype=np.int64),
+                     unmatched_normal, unmatched_impaired)
+
+
+def align_graphs(normal_graph, impaired_graph, key=None):
+    """Align graph nodes on the node itself, or on a node attribute such as 'path' when key is given."""
+    def keys_of(graph):
+        if key is None:
+            return list(graph.nodes)
+        return [graph.nodes[node][key] for node in graph.nodes]
+    return align_keys(keys_of(normal_graph), keys_of(impaired_graph))
@@ -0,0 +1,197 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from utils.cache import DiskCache
+from utils.config import cache_path
+
+DEFAULT_CACHE_PATH = cache_path('alt_text.sqlite')
+DEFAULT_API_BASE = "https://api.openai.com/v1"
+DEFAULT_PROMPT = "What’s in this image?"
+# Bump when the prompt or the image preprocessing changes, so cached descriptions are not reused
+PROMPT_VERSION = 1
+# base64 turns every 3 input bytes into 4 output characters, so chunks must be a multiple of 3
+CHUNK_SIZE = 3 * (1 << 16)
+DATA_URL_PLACEHOLDER = "__IMAGE_DATA_URL__"
+MIME_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif',
+              '.webp': 'image/webp', '.svg': 'image/svg+xml'}
+
+
+def file_sha256(path):
+    """Content hash of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prepare_image(path, max_side=1024, max_bytes=1 << 19, quality=85):
+    """
+    Return (file-like object, mime type) for the image to upload.
+
+    Images larger than max_side pixels on either side, or than max_bytes on disk, are
+    downscaled and re-encoded as JPEG when Pillow is installed; otherwise, and for
+    files Pillow cannot read (such as SVG), the file is sent as it is.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+
+    if Image is not None:
+        # UnidentifiedImageError, raised for formats Pillow does not read, is an OSError
+        try:
+            with Image.open(path) as image:
+                if max(image.size) > max_side or os.path.getsize(path) > max_bytes:
+                    image.thumbnail((max_side, max_side))
+                    buffer = io.BytesIO()
+                    image.convert('RGB').save(buffer, format='JPEG', quality=quality)
+                    buffer.seek(0)
+                    return buffer, 'image/jpeg'
+        except OSError as error:
+            print(f"Cannot downscale {path}, sending it unchanged: {error}")
+    mime = MIME_TYPES.get(os.path.splitext(path)[1].lower(), 'image/jpeg')
+    return open(path, 'rb'), mime
+
+
+def request_body(payload, image_file, mime):
+    """
+    Yield the JSON request body in pieces, base64-encoding the image chunk by chunk.
+
+    The payload holds DATA_URL_PLACEHOLDER where the image data URL goes, so the
+    encoded image is never held in memory as a whole.
+    """
+    prefix, suffix = json.dumps(payload).split(DATA_URL_PLACEHOLDER)
+    yield f"{prefix}data:{mime};base64,".encode('utf-8')
+    with image_file:
+        for chunk in iter(lambda: image_file.read(CHUNK_SIZE), b''):
+            yield base64.b64encode(chunk)
+    yield suffix.encode('utf-8')
+
+
+class AltTextGenerator:
+    """
+    Describes images with a vision model, concurrently and at most once per distinct image.
+
+    Images are keyed by content hash, so the same logo referenced by many pages (or
+    under different file names) is described once and then served from the cache.
+    """
+    def __init__(self, model="gpt-4o-mini", prompt=DEFAULT_PROMPT, max_tokens=300, max_side=1024, max_bytes=1 << 19,
+                 quality=85, max_workers=4, retries=3, backoff=1.0, timeout=60, cache_path=DEFAULT_CACHE_PATH,
+                 api_base=None, api_key=None):
+        self.model = model
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # api_base lets the generator run against a local stand-in endpoint
+        self.endpoint = f"{(api_base or os.getenv('OPENAI_API_BASE') or DEFAULT_API_BASE).rstrip('/')}/chat/completions"
+        self.api_key = api_key
+        self.cache = DiskCache(cache_path, max_entries=50000) if cache_path else None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def cache_key(self, digest):
+        # Every setting of prepare_image changes what the model sees, so each is part of the key
+        return f"{self.model}:v{PROMPT_VERSION}:{self.max_side}:{self.max_bytes}:{self.quality}:{digest}"
+
+    def _payload(self):
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": self.prompt},
+                        {"type": "image_url", "image_url": {"url": DATA_URL_PLACEHOLDER}}
+                    ]
+                }
+            ],
+            "max_tokens": self.max_tokens
+        }
+
+    def _request(self, path):
+        import openai
+
+        headers = {"Content-Type": "application/json",
+                   "Authorization": f"Bearer {self.api_key or openai.api_key}"}
+        for attempt in range(self.retries + 1):
+            # The body is a generator, so it is rebuilt for every attempt
+            try:
+                image_file, mime = prepare_image(path, self.max_side, self.max_bytes, self.quality)
+            except OSError as error:
+                print(f"Cannot read image {path}: {error}")
+                return None
+            try:
+                response = self.session.post(self.endpoint, headers=headers, timeout=self.timeout,
+                                             data=request_body(self._payload(), image_file, mime))
+            except requests.RequestException as error:
+                print(f"Error describing {path}: {error}")
+                response = None
+            if response is not None and response.status_code == 200:
+                choices = response.json().get("choices")
+                if not choices:
+                    print(f"Error: No choices found in the response for {path}")
+                    return None
+                return choices[0].get("message", {}).get("content", "").strip()
+            if response is not None and response.status_code not in (429, 500, 502, 503, 504):
+                print(f"Error: Received status code {response.status_code} for {path}: {response.text}")
+                return None
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+        return None
+
+    def describe_many(self, paths):
+        """Return {path: description} for the image files (None where no description could be generated)."""
+        paths = list(dict.fromkeys(paths))
+        digests = {}
+        for path in paths:
+            try:
+                digests[path] = file_sha256(path)
+            except OSError as error:
+                print(f"Cannot read image {path}: {error}")
+        keys = {digest: self.cache_key(digest) for digest in digests.values()}
+
+        descriptions = {}
+        if self.cache is not None:
+            cached = self.cache.get_many(keys.values())
+            descriptions = {digest: cached[key].decode('utf-8') for digest, key in keys.items() if key in cached}
+
+        # One request per distinct image that is not cached yet
+        missing = {}
+        for path, digest in digests.items():
+            if digest not in descriptions:
+                missing.setdefault(digest, path)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            generated = dict(zip(missing, executor.map(self._request, missing.values())))
+        if self.cache is not None:
+            self.cache.set_many((keys[digest], text.encode('utf-8')) for digest, text in generated.items() if text)
+        descriptions.update(generated)
+
+        return {path: descriptions[digests[path]] if path in digests else None for path in paths}
+
+    def describe(self, path):
+        return self.describe_many([path])[path]
+
+
+_generators = {}
+
+
+def get_alt_text_generator(model="gpt-4o-mini"):
+    """Shared generator per model."""
+    if model not in _generators:
+        _generators[model] = AltTextGenerator(model=model)
+    return _generators[model]
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from utils.config import cache_path
+
+DEFAULT_ARTIFACT_DIR = cache_path('artifacts')
+# Bump a stage's version when the code that produces it changes, so stale artifacts are not loaded
+STAGE_VERSIONS = {'nodes': 1, 'features': 1, 'edges': 1, 'embeddings': 1}
+META_FILE = 'meta.json'
+
+
+def page_hash(html):
+    """Key of a page in the store: the hash of its HTML."""
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+class ArtifactStore:
+    """
+    On-disk results of each pipeline stage, one directory per page and stage.
+
+    A stage directory is named after the stage, its version in STAGE_VERSIONS and a
+    hash of its variant (the settings it depends on, such as the embedding provider
+    or edge mode). Arrays are stored as .npy files, so they can be memory-mapped
+    without being read in full; node tables and other lists are stored as JSON. The
+    directory is written under a temporary name and renamed once complete, so a
+    stage that exists was finished, and a rerun resumes after the last one.
+    """
+    def __init__(self, directory=DEFAULT_ARTIFACT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def stage_dir(self, page, stage, variant=''):
+        name = f"{stage}-v{STAGE_VERSIONS[stage]}"
+        if variant:
+            name += '-' + hashlib.sha1(variant.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.directory, page, name)
+
+    def has(self, page, stage, variant=''):
+        return os.path.exists(os.path.join(self.stage_dir(page, stage, variant), META_FILE))
+
+    def save(self, page, stage, arrays=None, tables=None, variant=''):
+        """Store a completed stage: arrays as .npy files and tables as JSON files, by name."""
+        arrays, tables = arrays or {}, tables or {}
+        final = self.stage_dir(page, stage, variant)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        temporary = tempfile.mkdtemp(prefix=f".{stage}-", dir=os.path.dirname(final))
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(temporary, f"{name}.npy"), np.asarray(array))
+            for name, table in tables.items():
+                with open(os.path.join(temporary, f"{name}.json"), 'w', encoding='utf-8') as file:
+                    json.dump(table, file)
+            meta = {'stage': stage, 'version': STAGE_VERSIONS[stage], 'variant': variant, 'created': time.time(),
+                    'arrays': {name: {'shape': list(np.shape(array)), 'dtype': str(np.asarray(array).dtype)}
+                               for name, array in arrays.items()},
+                    'tables': sorted(tables)}
+            with open(os.path.join(temporary, META_FILE), 'w', encoding='utf-8') as file:
+                json.dump(meta, file, indent=2)
+            if os.path.exists(final):
+                shutil.rmtree(final)
+            os.replace(temporary, final)
+        except BaseException:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+        return final
+
+    def load(self, page, stage, variant='', mmap=True):
+        """Return {name: array or table} for a completed stage, or None; arrays are memory-mapped unless mmap=False."""
+        directory = self.stage_dir(page, stage, variant)
+        if not os.path.exists(os.path.join(directory, META_FILE)):
+            return None
+        with open(os.path.join(directory, META_FILE), 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        loaded = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r' if mmap else None)
+                  for name in meta['arrays']}
+        for name in meta['tables']:
+            with open(os.path.join(directory, f"{name}.json"), 'r', encoding='utf-8') as file:
+                loaded[name] = json.load(file)
+        return loaded
+
+    def stages(self, page):
+        """Metadata of every completed stage of a page."""
+        directory = os.path.join(self.directory, page)
+        found = []
+        for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+            path = os.path.join(directory, name, META_FILE)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as file:
+                    found.append(json.load(file))
+        return found
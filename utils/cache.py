@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import time
+
+
+class DiskCache:
+    """
+    Persistent key/value cache stored in sqlite with least-recently-used eviction.
+
+    With a ttl (in seconds), entries older than ttl are treated as missing and are
+    dropped on the next write. hits and misses count lookups since the cache was opened.
+    """
+    # sqlite limits the number of bound parameters per statement
+    chunk_size = 500
+
+    def __init__(self, path, max_entries=100000, ttl=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, accessed REAL NOT NULL, "
+            "created REAL NOT NULL DEFAULT 0)"
+        )
+        # Caches written before entries had a creation time count as expired when a ttl is set
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(cache)")]
+        if 'created' not in columns:
+            self.conn.execute("ALTER TABLE cache ADD COLUMN created REAL NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """Return a dict with the cached values for the keys that are present."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        oldest = now - self.ttl if self.ttl else 0
+        for start in range(0, len(keys), self.chunk_size):
+            chunk = keys[start:start + self.chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND created >= ?", chunk + [oldest]
+            ).fetchall()
+            found.update(rows)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        if found:
+            self.conn.executemany("UPDATE cache SET accessed = ? WHERE key = ?", [(now, key) for key in found])
+            self.conn.commit()
+        return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items):
+        """Store (key, value) pairs and evict the oldest entries beyond max_entries."""
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO cache (key, value, accessed, created) VALUES (?, ?, ?, ?)",
+            [(key, value, now, now) for key, value in items],
+        )
+        self._evict()
+        self.conn.commit()
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+    def _evict(self):
+        if self.ttl:
+            self.conn.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.ttl,))
+        count = self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)", (excess,)
+            )
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self)}
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
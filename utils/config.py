@@ -0,0 +1,17 @@
+import os
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache')
+
+
+def cache_path(name):
+    """Path of a cache file or directory under the repository's .cache directory."""
+    return os.path.join(CACHE_DIR, name)
+
+
+def configure_openai():
+    """Load .env and set the OpenAI API key. Entry points call this instead of doing it at import time."""
+    import openai
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    openai.api_key = os.getenv("OPENAI_API_KEY")
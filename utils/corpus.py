@@ -0,0 +1,171 @@
+import json
+import os
+import numpy as np
+from utils.distance import distance_block, prepare_embeddings
+from utils.config import cache_path
+
+DEFAULT_CORPUS_DIR = cache_path('corpus')
+MATRIX_FILE = 'embeddings.f32'
+OFFSETS_FILE = 'offsets.i64'
+METADATA_FILE = 'nodes.jsonl'
+META_FILE = 'meta.json'
+
+
+class CorpusEmbeddingStore:
+    """
+    Node embeddings of many pages in one memory-mapped float32 matrix.
+
+    Rows are appended to embeddings.f32 (raw float32, row-major) and described by one
+    JSON line each in nodes.jsonl, whose byte offsets are kept in offsets.i64 so a row's
+    metadata is read without scanning the file. meta.json records the width and the
+    number of committed rows; rows past that count (from an interrupted append) are
+    ignored and overwritten by the next append. Queries read the matrix block by
+    block, so memory does not grow with the corpus. `space` names what the rows are
+    (e.g. the embedding provider or the encoder), so incomparable rows are not mixed.
+    """
+    def __init__(self, directory=DEFAULT_CORPUS_DIR, dim=None, space=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                self.meta = json.load(file)
+            if dim is not None and dim != self.meta['dim']:
+                raise ValueError(f"Corpus at {directory} holds {self.meta['dim']}-dimensional embeddings, not {dim}")
+            if space is not None and space != self.meta['space']:
+                raise ValueError(f"Corpus at {directory} holds {self.meta['space']} embeddings, not {space}")
+        else:
+            self.meta = {'dim': dim, 'space': space, 'rows': 0, 'metadata_bytes': 0, 'pages': []}
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    @property
+    def dim(self):
+        return self.meta['dim']
+
+    def matrix(self):
+        """Read-only memory map of the committed rows."""
+        if not len(self):
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self._path(MATRIX_FILE), dtype=np.float32, mode='r', shape=(len(self), self.dim))
+
+    def add(self, embeddings, metadata):
+        """Append embedding rows with one metadata dict per row; returns the row numbers."""
+        rows = self._append(embeddings, metadata)
+        self._save_meta()
+        return rows
+
+    def _append(self, embeddings, metadata):
+        # Writes the rows and counts them in self.meta; they are committed by the next _save_meta
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        metadata = list(metadata)
+        if embeddings.ndim != 2 or len(embeddings) != len(metadata):
+            raise ValueError("Expected a 2-D embedding matrix with one metadata entry per row")
+        if self.dim is None:
+            self.meta['dim'] = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {embeddings.shape[1]}")
+
+        lines = [(json.dumps(entry) + '\n').encode('utf-8') for entry in metadata]
+        offsets = self.meta['metadata_bytes'] + np.cumsum([0] + [len(line) for line in lines[:-1]], dtype=np.int64)
+        # Truncate to the committed size first, dropping anything a crashed append left behind
+        for name, size, data in ((MATRIX_FILE, len(self) * self.dim * 4, embeddings.tobytes()),
+                                 (OFFSETS_FILE, len(self) * 8, offsets.astype(np.int64).tobytes()),
+                                 (METADATA_FILE, self.meta['metadata_bytes'], b''.join(lines))):
+            with open(self._path(name), 'ab') as file:
+                file.truncate(size)
+                file.write(data)
+
+        start = len(self)
+        self.meta['rows'] += len(lines)
+        self.meta['metadata_bytes'] += sum(len(line) for line in lines)
+        return np.arange(start, len(self))
+
+    def add_page(self, page, records, embeddings, view='visual'):
+        """Append the node embeddings of one view of a page; a page and view already stored are skipped."""
+        key = f"{page}#{view}"
+        if key in self.meta['pages']:
+            return np.empty(0, dtype=np.int64)
+        metadata = [{'page': page, 'view': view, 'node': record['id'], 'tag': record['tag'], 'path': record['path'],
+                     'text': record['text'][:200]} for record in records]
+        # The page is recorded only once its rows are written, and both are committed in one meta.json write
+        rows = self._append(embeddings, metadata)
+        self.meta['pages'].append(key)
+        self._save_meta()
+        return rows
+
+    def _save_meta(self):
+        # Write then rename, so meta.json only ever counts fully written rows
+        temporary = self._path(META_FILE + '.tmp')
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.meta, file)
+        os.replace(temporary, self._path(META_FILE))
+
+    def metadata(self, rows):
+        """Metadata dicts of the given rows."""
+        rows = np.atleast_1d(np.asarray(rows, dtype=np.int64))
+        if not len(rows):
+            return []
+        offsets = np.memmap(self._path(OFFSETS_FILE), dtype=np.int64, mode='r', shape=(len(self),))
+        entries = []
+        with open(self._path(METADATA_FILE), 'rb') as file:
+            for row in rows:
+                file.seek(int(offsets[row]))
+                entries.append(json.loads(file.readline()))
+        return entries
+
+    def find(self, **conditions):
+        """Rows whose metadata matches every condition, e.g. find(page='a.html', node=12), in one pass over nodes.jsonl."""
+        rows = []
+        with open(self._path(METADATA_FILE), 'rb') as file:
+            for row in range(len(self)):
+                entry = json.loads(file.readline())
+                if all(entry.get(name) == value for name, value in conditions.items()):
+                    rows.append(row)
+        return np.array(rows, dtype=np.int64)
+
+    def query(self, vectors, k=10, metric='cosine', block_size=4096, exclude=None):
+        """
+        Top-k nearest rows for each query vector.
+
+        Returns (rows, distances), both of shape (queries, k) and sorted by distance.
+        The matrix is read block_size rows at a time and only the running k best per
+        query are kept between blocks. Rows in `exclude` (e.g. the query's own row)
+        are skipped.
+        """
+        queries = prepare_embeddings(np.atleast_2d(vectors), metric)
+        if not len(self):
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0))
+        matrix = self.matrix()
+        k = min(k, len(self))
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_distances = np.empty((len(queries), 0))
+        excluded = np.asarray(exclude if exclude is not None else [], dtype=np.int64)
+        for start in range(0, len(self), block_size):
+            block = distance_block(queries, prepare_embeddings(matrix[start:start + block_size], metric), metric)
+            skipped = excluded[(excluded >= start) & (excluded < start + block_size)] - start
+            block[:, skipped] = np.inf
+            rows = np.broadcast_to(np.arange(start, start + block.shape[1]), block.shape)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            best_distances = np.concatenate([best_distances, block], axis=1)
+            if best_distances.shape[1] > k:
+                keep = np.argpartition(best_distances, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_distances = np.take_along_axis(best_distances, keep, axis=1)
+
+        order = np.argsort(best_distances, axis=1, kind='stable')
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_distances = np.take_along_axis(best_distances, order, axis=1)
+        # With fewer usable rows than k, excluded rows can remain at infinite distance
+        finite = np.isfinite(best_distances).all(axis=0)
+        return best_rows[:, finite], best_distances[:, finite]
+
+    def nearest(self, vector, k=10, metric='cosine', exclude=None):
+        """The k rows nearest one vector, as metadata dicts with a 'distance' key."""
+        rows, distances = self.query(vector, k=k, metric=metric, exclude=exclude)
+        return [dict(entry, row=int(row), distance=float(distance))
+                for entry, row, distance in zip(self.metadata(rows[0]), rows[0], distances[0])]
@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlsplit
+from xml.etree import ElementTree
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.cache import DiskCache
+from utils.config import cache_path
+
+DEFAULT_CACHE_PATH = cache_path('http.sqlite')
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# status is None when the request failed after all retries, with the reason in error;
+# from_cache is True on a 304 revalidation
+FetchResult = namedtuple('FetchResult', ['url', 'status', 'html', 'from_cache', 'error'], defaults=(None,))
+
+
+def make_session(pool_size=8, retries=3, backoff=0.5, user_agent='a11metrics-crawler'):
+    """requests.Session with a connection pool of pool_size per host and retries with exponential backoff."""
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=('GET',), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = user_agent
+    return session
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host to at most `rate` per second, across threads."""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, host):
+        # Reserve the next free slot for this host, then sleep outside the lock until it comes
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def parse_sitemap(xml_text):
+    """Return (is_index, locations) for a sitemap or sitemap index document."""
+    root = ElementTree.fromstring(xml_text)
+    # Sitemaps are namespaced; match on the local tag name
+    locations = [element.text.strip() for element in root.iter() if element.tag.rsplit('}', 1)[-1] == 'loc' and element.text]
+    return root.tag.rsplit('}', 1)[-1] == 'sitemapindex', locations
+
+
+class Crawler:
+    """
+    Concurrent page fetcher: a thread pool sharing one pooled session, with per-host
+    rate limits, retries and an ETag/Last-Modified cache of the pages it has seen.
+
+    Relative URLs are resolved against base_url, so a crawl can be pointed at a local
+    fixture server. The cache is only touched from the thread that iterates crawl().
+    """
+    def __init__(self, base_url=None, max_workers=8, rate_limit=2.0, timeout=10, retries=3,
+                 cache_path=DEFAULT_CACHE_PATH, max_entries=10000):
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = make_session(pool_size=max_workers, retries=retries)
+        self.limiter = HostRateLimiter(rate_limit)
+        self.cache = DiskCache(cache_path, max_entries=max_entries) if cache_path else None
+
+    def resolve(self, url):
+        return urljoin(self.base_url, url) if self.base_url else url
+
+    def get(self, url, headers=None):
+        self.limiter.wait(urlsplit(url).netloc)
+        return self.session.get(url, headers=headers, timeout=self.timeout)
+
+    def sitemap_urls(self, sitemap_url):
+        """Page URLs listed in a sitemap, following sitemap indexes."""
+        response = self.get(self.resolve(sitemap_url))
+        response.raise_for_status()
+        is_index, locations = parse_sitemap(response.content)
+        if not is_index:
+            return locations
+        urls = []
+        for location in locations:
+            urls.extend(self.sitemap_urls(location))
+        return urls
+
+    def _fetch(self, url, cached):
+        headers = {}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        try:
+            response = self.get(url, headers=headers)
+        except requests.RequestException as error:
+            # Reported through the FetchResult, so one failed URL does not stop the crawl
+            return url, None, None, None, str(error)
+        return url, response.status_code, response.text, response.headers, None
+
+    def crawl(self, urls):
+        """Fetch the URLs concurrently and yield a FetchResult per URL as each one completes."""
+        urls = list(dict.fromkeys(self.resolve(url) for url in urls))
+        cached = {}
+        if self.cache is not None:
+            cached = {key[len('http:'):]: json.loads(value)
+                      for key, value in self.cache.get_many(f'http:{url}' for url in urls).items()}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._fetch, url, cached.get(url)) for url in urls]
+            for future in as_completed(futures):
+                url, status, html, headers, error = future.result()
+                if status == 304 and url in cached:
+                    yield FetchResult(url, status, cached[url]['html'], True)
+                    continue
+                if status != 200:
+                    yield FetchResult(url, status, None, False, error)
+                    continue
+                if self.cache is not None and (headers.get('ETag') or headers.get('Last-Modified')):
+                    entry = {'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'), 'html': html}
+                    self.cache.set(f'http:{url}', json.dumps(entry).encode('utf-8'))
+                yield FetchResult(url, status, html, False)
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
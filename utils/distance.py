@@ -0,0 +1,193 @@
+from collections import namedtuple
+import numpy as np
+
+METRICS = ('euclidean', 'manhattan', 'cosine')
+DISCREPANCY_METHODS = ('auto', 'blocks', 'tree')
+# With method='auto', euclidean and cosine use the neighbour tree for pages of at least TREE_MIN_NODES nodes
+# in at most TREE_MAX_DIMS dimensions; beyond that the tree prunes little and the BLAS-backed blocks win
+TREE_MIN_NODES = 2048
+TREE_MAX_DIMS = 32
+
+# Discrepant node pairs as parallel arrays: node indices i < j and both distances
+Discrepancies = namedtuple('Discrepancies', ['i', 'j', 'normal_dist', 'impaired_dist'])
+
+
+def prepare_embeddings(embeddings, metric):
+    """Convert embeddings to float64 rows, L2-normalized for the cosine metric."""
+    if metric not in METRICS:
+        raise ValueError("Unsupported metric")
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    if metric == 'cosine':
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        embeddings = embeddings / norms
+    return embeddings
+
+
+def distance_block(a, b, metric):
+    """Distances between every row of `a` and every row of `b` (inputs from prepare_embeddings)."""
+    if metric == 'euclidean':
+        squared = (a * a).sum(axis=1)[:, None] + (b * b).sum(axis=1)[None, :] - 2 * a @ b.T
+        return np.sqrt(np.maximum(squared, 0))
+    if metric == 'manhattan':
+        # Accumulate one feature column at a time so memory stays at len(a) x len(b)
+        block = np.zeros((len(a), len(b)))
+        for k in range(a.shape[1]):
+            block += np.abs(a[:, k, None] - b[None, :, k])
+        return block
+    if metric == 'cosine':
+        return np.maximum(1 - a @ b.T, 0)
+    raise ValueError("Unsupported metric")
+
+
+def paired_distances(a, b, metric):
+    """Distances between a[k] and b[k] for every k."""
+    if metric == 'euclidean':
+        return np.linalg.norm(a - b, axis=1)
+    if metric == 'manhattan':
+        return np.abs(a - b).sum(axis=1)
+    if metric == 'cosine':
+        return np.maximum(1 - (a * b).sum(axis=1), 0)
+    raise ValueError("Unsupported metric")
+
+
+def iter_distance_blocks(embeddings, metric='euclidean', block_size=1024, upper=False):
+    """
+    Yield (row_start, col_start, block) tiles of the pairwise distance matrix.
+
+    Each tile is at most block_size x block_size. With upper=True only the tiles
+    on or above the diagonal are produced.
+    """
+    embeddings = prepare_embeddings(embeddings, metric)
+    n = len(embeddings)
+    for row_start in range(0, n, block_size):
+        rows = embeddings[row_start:row_start + block_size]
+        for col_start in range(row_start if upper else 0, n, block_size):
+            cols = embeddings[col_start:col_start + block_size]
+            yield row_start, col_start, distance_block(rows, cols, metric)
+
+
+def pairwise_distances(embeddings, metric='euclidean', block_size=1024):
+    """Full N x N distance matrix, computed tile by tile."""
+    n = len(embeddings)
+    matrix = np.empty((n, n))
+    for row_start, col_start, block in iter_distance_blocks(embeddings, metric, block_size):
+        matrix[row_start:row_start + block.shape[0], col_start:col_start + block.shape[1]] = block
+    return matrix
+
+
+def radius_pairs(embeddings, radius, metric, block_size=1024):
+    """
+    Pairs i < j closer than `radius`, found with a KD-tree or ball tree instead of all pairs.
+
+    Takes embeddings from prepare_embeddings. Cosine distance between unit rows is half
+    their squared euclidean distance, so the cosine radius r becomes a euclidean
+    radius of sqrt(2r). The tree lookup is inclusive and works in a different floating
+    point order, so it uses a slightly larger radius and the candidates are then
+    filtered on the exact distance. Returns (i, j, distance) arrays.
+    """
+    from sklearn.neighbors import BallTree, KDTree
+
+    tree_metric, tree_radius = ('euclidean', np.sqrt(2 * radius)) if metric == 'cosine' else (metric, radius)
+    # KD-trees prune well in few dimensions; ball trees hold up better in many
+    tree = (KDTree if embeddings.shape[1] <= TREE_MAX_DIMS else BallTree)(embeddings, metric=tree_metric)
+    found_i, found_j = [], []
+    for start in range(0, len(embeddings), block_size):
+        neighbours = tree.query_radius(embeddings[start:start + block_size], r=tree_radius * (1 + 1e-6) + 1e-12)
+        counts = np.array([len(row) for row in neighbours], dtype=np.int64)
+        i = np.repeat(np.arange(start, start + len(neighbours)), counts)
+        j = np.concatenate(neighbours).astype(np.int64) if counts.sum() else np.empty(0, dtype=np.int64)
+        keep = i < j
+        found_i.append(i[keep])
+        found_j.append(j[keep])
+    i = np.concatenate(found_i) if found_i else np.empty(0, dtype=np.int64)
+    j = np.concatenate(found_j) if found_j else np.empty(0, dtype=np.int64)
+    distance = np.empty(0)
+    if len(i):
+        distance = np.concatenate([paired_distances(embeddings[i[k:k + 65536]], embeddings[j[k:k + 65536]], metric)
+                                   for k in range(0, len(i), 65536)])
+    keep = distance < radius
+    i, j, distance = i[keep], j[keep], distance[keep]
+    order = np.lexsort((j, i))
+    return i[order], j[order], distance[order]
+
+
+def auto_method(nodes, dims, metric):
+    """The faster discrepancy method for a page of `nodes` embeddings of width `dims` (see find_discrepancies)."""
+    try:
+        import sklearn.neighbors  # noqa: F401
+    except ImportError:
+        return 'blocks'
+    low_dimensional = nodes >= TREE_MIN_NODES and dims <= TREE_MAX_DIMS
+    return 'tree' if metric == 'manhattan' or low_dimensional else 'blocks'
+
+
+def find_discrepancies(normal_embeddings, impaired_embeddings, metric='euclidean',
+                       normal_threshold=0.1, impaired_threshold=0.1, block_size=1024, method='blocks'):
+    """
+    Find node pairs i < j that are close in the normal embeddings (distance below
+    normal_threshold) but far apart in the impaired ones (above impaired_threshold).
+
+    method='blocks' scans all pairs, holding one block of normal distances in memory
+    at a time. method='tree' only visits the pairs within normal_threshold of each
+    other, through a neighbour tree over the normal embeddings (radius_pairs), which
+    is close to linear on large pages where few pairs are that close. method='auto'
+    picks the tree when scikit-learn is installed and it is the faster one: always for
+    manhattan, whose blocks have no matrix-product shortcut, and for euclidean and
+    cosine on large, low-dimensional embeddings. Either way, impaired distances are
+    computed just for the pairs that pass the normal threshold.
+    """
+    if method not in DISCREPANCY_METHODS:
+        raise ValueError("Unsupported discrepancy method")
+    n = min(len(normal_embeddings), len(impaired_embeddings))
+    normal = prepare_embeddings(normal_embeddings[:n], metric)
+    impaired = prepare_embeddings(impaired_embeddings[:n], metric)
+
+    if method == 'auto':
+        method = auto_method(n, normal.shape[1], metric)
+    if method == 'tree':
+        i, j, normal_dist = radius_pairs(normal, normal_threshold, metric, block_size)
+        impaired_dist = paired_distances(impaired[i], impaired[j], metric)
+        keep = impaired_dist > impaired_threshold
+        return Discrepancies(i[keep], j[keep], normal_dist[keep], impaired_dist[keep])
+
+    found_i, found_j, found_normal, found_impaired = [], [], [], []
+    for row_start in range(0, n, block_size):
+        rows = normal[row_start:row_start + block_size]
+        for col_start in range(row_start, n, block_size):
+            block = distance_block(rows, normal[col_start:col_start + block_size], metric)
+            mask = block < normal_threshold
+            if col_start == row_start:
+                mask &= np.triu(np.ones(mask.shape, dtype=bool), k=1)
+            if not mask.any():
+                continue
+            block_i, block_j = np.nonzero(mask)
+            i = block_i + row_start
+            j = block_j + col_start
+            impaired_dist = paired_distances(impaired[i], impaired[j], metric)
+            keep = impaired_dist > impaired_threshold
+            found_i.append(i[keep])
+            found_j.append(j[keep])
+            found_normal.append(block[block_i[keep], block_j[keep]])
+            found_impaired.append(impaired_dist[keep])
+
+    if not found_i:
+        empty_index = np.empty(0, dtype=np.int64)
+        return Discrepancies(empty_index, empty_index, np.empty(0), np.empty(0))
+    return Discrepancies(np.concatenate(found_i), np.concatenate(found_j),
+                         np.concatenate(found_normal), np.concatenate(found_impaired))
+
+
+def mean_distances(embeddings, rows=None, metric='euclidean', block_size=1024):
+    """Mean distance from each selected row (all rows by default) to every row, in one blocked pass."""
+    embeddings = prepare_embeddings(embeddings, metric)
+    rows = np.arange(len(embeddings)) if rows is None else np.asarray(rows, dtype=np.int64)
+    means = np.zeros(len(rows))
+    if len(embeddings) == 0:
+        return means
+    for row_start in range(0, len(rows), block_size):
+        selected = embeddings[rows[row_start:row_start + block_size]]
+        for col_start in range(0, len(embeddings), block_size):
+            block = distance_block(selected, embeddings[col_start:col_start + block_size], metric)
+            means[row_start:row_start + len(selected)] += block.sum(axis=1)
+    return means / len(embeddings)
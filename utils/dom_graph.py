@@ -0,0 +1,105 @@
+import networkx as nx
+from bs4.element import NavigableString, PreformattedString
+
+ARIA_REFERENCE_ATTRS = ['aria-labelledby', 'aria-describedby']
+
+
+def element_parents(elements):
+    """Return the index of each element's parent within `elements` (None for roots)."""
+    index = {id(element): i for i, element in enumerate(elements)}
+    return [index.get(id(element.parent)) for element in elements]
+
+
+def dom_edges(parents, attrs, siblings=False, aria_refs=False):
+    """
+    Yield (src, dst, kind) index triples for a document given in document order.
+
+    Every element is linked to its parent ('child' edges). Optionally consecutive
+    siblings are linked ('sibling' edges) and elements are linked to the elements
+    they reference through aria-labelledby/aria-describedby ('aria' edges). The
+    number of edges grows linearly with the number of elements.
+    """
+    last_child = {}
+    for i, parent in enumerate(parents):
+        if parent is None:
+            continue
+        yield parent, i, 'child'
+        if siblings:
+            previous = last_child.get(parent)
+            if previous is not None:
+                yield previous, i, 'sibling'
+            last_child[parent] = i
+
+    if aria_refs:
+        ids = {}
+        for i, element_attrs in enumerate(attrs):
+            element_id = element_attrs.get('id')
+            if isinstance(element_id, str):
+                ids.setdefault(element_id, i)
+        for i, element_attrs in enumerate(attrs):
+            for attr in ARIA_REFERENCE_ATTRS:
+                value = element_attrs.get(attr)
+                if not value:
+                    continue
+                refs = value if isinstance(value, list) else value.split()
+                for ref in refs:
+                    target = ids.get(ref)
+                    if target is not None and target != i:
+                        yield i, target, 'aria'
+
+
+def direct_text(element):
+    """Text held directly by `element`, excluding comments, doctypes and descendants' text."""
+    parts = (child.strip() for child in element.children
+             if isinstance(child, NavigableString) and not isinstance(child, PreformattedString))
+    return ' '.join(part for part in parts if part)
+
+
+def dom_paths(elements, parents=None):
+    """XPath-like DOM path of each element, such as /html[1]/body[1]/div[2], for elements in document order."""
+    if parents is None:
+        parents = element_parents(elements)
+    paths = []
+    tag_counts = {}
+    for element, parent in zip(elements, parents):
+        counts = tag_counts.setdefault(parent, {})
+        counts[element.name] = counts.get(element.name, 0) + 1
+        prefix = paths[parent] if parent is not None else ''
+        paths.append(f"{prefix}/{element.name}[{counts[element.name]}]")
+    return paths
+
+
+def node_records(soup):
+    """
+    Return one record per element of `soup` in document order.
+
+    A record holds the element's integer id (its position in document order), the
+    id of its parent, its tag name, attributes, direct text and an XPath-like DOM
+    path such as /html[1]/body[1]/div[2].
+    """
+    elements = soup.find_all()
+    parents = element_parents(elements)
+    records = []
+    for i, (element, parent, path) in enumerate(zip(elements, parents, dom_paths(elements, parents))):
+        records.append({
+            'id': i,
+            'parent': parent,
+            'tag': element.name,
+            'attrs': dict(element.attrs),
+            'text': direct_text(element),
+            'path': path,
+        })
+    return records
+
+
+def build_dom_graph(records, siblings=False, aria_refs=False):
+    """Build a networkx graph with one integer-keyed node per record plus DOM edges."""
+    graph = nx.Graph()
+    for record in records:
+        graph.add_node(record['id'], tag=record['tag'], attrs=record['attrs'], text=record['text'], path=record['path'])
+
+    parents = [record['parent'] for record in records]
+    attrs = [record['attrs'] for record in records]
+    for src, dst, kind in dom_edges(parents, attrs, siblings=siblings, aria_refs=aria_refs):
+        graph.add_edge(records[src]['id'], records[dst]['id'], kind=kind)
+    return graph
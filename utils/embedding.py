@@ -0,0 +1,194 @@
+import hashlib
+import os
+import numpy as np
+from utils.cache import DiskCache
+from utils.config import cache_path
+
+ADA_MODEL = 'text-embedding-ada-002'
+ADA_EMBEDDING_SIZE = 1536
+DEFAULT_CACHE_PATH = cache_path('embeddings.sqlite')
+
+
+def text_key(model, text):
+    """Cache key for an embedding: the model name plus a hash of the text."""
+    return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+class EmbeddingClient:
+    """Deduplicating, batching OpenAI embedding client with a persistent on-disk cache."""
+    name = 'openai'
+
+    def __init__(self, model=ADA_MODEL, batch_size=256, cache_path=DEFAULT_CACHE_PATH, max_entries=200000, api_base=None,
+                 dim=ADA_EMBEDDING_SIZE):
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+        # api_base lets the client run against a local stand-in embedding server
+        self.api_base = api_base or os.getenv("OPENAI_API_BASE")
+        self.cache = DiskCache(cache_path, max_entries=max_entries) if cache_path else None
+
+    def _request(self, texts):
+        import openai
+
+        kwargs = {'api_base': self.api_base} if self.api_base else {}
+        response = openai.Embedding.create(input=texts, model=self.model, **kwargs)
+        # The API does not guarantee that results come back in input order
+        return [item['embedding'] for item in sorted(response['data'], key=lambda item: item['index'])]
+
+    def embed(self, texts):
+        """Return a float32 matrix with one embedding row per input text, in input order."""
+        texts = [str(text) for text in texts]
+        unique = list(dict.fromkeys(texts))
+        keys = {text: text_key(self.model, text) for text in unique}
+
+        embeddings = {}
+        if self.cache is not None:
+            cached = self.cache.get_many(keys.values())
+            for text in unique:
+                if keys[text] in cached:
+                    embeddings[text] = np.frombuffer(cached[keys[text]], dtype=np.float32)
+
+        missing = [text for text in unique if text not in embeddings]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            results = np.asarray(self._request(batch), dtype=np.float32)
+            embeddings.update(zip(batch, results))
+            if self.cache is not None:
+                self.cache.set_many((keys[text], result.tobytes()) for text, result in zip(batch, results))
+
+        matrix = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            matrix[i] = embeddings[text]
+        return matrix
+
+
+# Constants of the 64-bit hash used for n-grams (FNV prime and the murmur3 finalizer)
+HASH_PRIME = np.uint64(0x100000001b3)
+MIX_MULTIPLIER = np.uint64(0xff51afd7ed558ccd)
+
+
+class HashingEmbeddingProvider:
+    """
+    Offline embeddings: signed feature hashing of character n-grams.
+
+    Each text is lowercased, its UTF-8 character n-grams (ngram_range, padded with a
+    space on both sides so word boundaries count) are hashed into `dim` buckets with a
+    pseudo-random sign, and counts are log-scaled and L2-normalized. A whole batch is
+    hashed with vectorized numpy operations, so no network or model files are needed
+    and thousands of node texts are embedded per second on a CPU.
+    """
+    name = 'hashing'
+
+    def __init__(self, dim=512, ngram_range=(3, 5), batch_size=1024):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.batch_size = batch_size
+
+    def _embed_batch(self, texts):
+        encoded = [f" {text.lower()} ".encode('utf-8') for text in texts]
+        rows = np.repeat(np.arange(len(texts)), [len(item) for item in encoded])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+
+        counts = np.zeros(len(texts) * self.dim)
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            size = len(data) - n + 1
+            if size <= 0:
+                break
+            # Polynomial hash of every n-gram at once, seeded with n so orders do not collide
+            hashes = np.full(size, n, dtype=np.uint64)
+            for offset in range(n):
+                hashes = hashes * HASH_PRIME + data[offset:offset + size]
+            # Keep only n-grams that lie within a single text
+            inside = rows[:size] == rows[n - 1:]
+            hashes, ngram_rows = hashes[inside], rows[:size][inside]
+            hashes ^= hashes >> np.uint64(33)
+            hashes *= MIX_MULTIPLIER
+            hashes ^= hashes >> np.uint64(33)
+            buckets = (hashes % np.uint64(self.dim)).astype(np.int64)
+            signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)
+            counts += np.bincount(ngram_rows * self.dim + buckets, weights=signs, minlength=counts.size)
+
+        # Log-scale in place to keep the float64 temporaries of a batch to a minimum
+        matrix = counts.reshape(len(texts), self.dim)
+        signs = np.sign(matrix)
+        np.abs(matrix, out=matrix)
+        np.log1p(matrix, out=matrix)
+        matrix *= signs
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        matrix /= norms
+        return matrix.astype(np.float32)
+
+    def embed(self, texts):
+        """Return a float32 matrix with one embedding row per input text, in input order."""
+        texts = [str(text) for text in texts]
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            matrix[start:start + self.batch_size] = self._embed_batch(texts[start:start + self.batch_size])
+        return matrix
+
+
+# Embedding backends selectable by name, e.g. with A11METRIC_EMBEDDINGS=hashing
+EMBEDDING_PROVIDERS = {'openai': EmbeddingClient, 'hashing': HashingEmbeddingProvider}
+
+_default_client = None
+_default_provider = None
+
+
+def get_embedding_client():
+    global _default_client
+    if _default_client is None:
+        _default_client = EmbeddingClient()
+    return _default_client
+
+
+def make_embedding_provider(name, dim=None):
+    """Create a provider by name; dim overrides the dimensionality of the local backends."""
+    if name not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unsupported embedding provider: {name}")
+    if name == 'openai':
+        return get_embedding_client()
+    return EMBEDDING_PROVIDERS[name](**({'dim': dim} if dim else {}))
+
+
+def set_embedding_provider(provider, dim=None):
+    """Select the provider used for node features, by name or as an object with dim and embed(texts)."""
+    global _default_provider
+    _default_provider = make_embedding_provider(provider, dim) if isinstance(provider, str) else provider
+
+
+def get_embedding_provider():
+    """The selected provider: set_embedding_provider, then A11METRIC_EMBEDDINGS (and A11METRIC_EMBEDDING_DIM), then OpenAI."""
+    global _default_provider
+    if _default_provider is None:
+        dim = os.getenv("A11METRIC_EMBEDDING_DIM")
+        _default_provider = make_embedding_provider(os.getenv("A11METRIC_EMBEDDINGS", "openai"), int(dim) if dim else None)
+    return _default_provider
+
+
+def embedding_matrix(texts, dtype=np.float32, provider=None, chunk_size=4096):
+    """
+    Embed one text per row into a preallocated matrix; rows of empty texts stay zero.
+
+    The zero rows cost nothing until written (np.zeros memory is allocated lazily),
+    and the provider is called chunk by chunk so only one chunk of float32 output is
+    alive at a time. dtype may be float16 to halve the stored size.
+    """
+    provider = provider or get_embedding_provider()
+    matrix = np.zeros((len(texts), provider.dim), dtype=dtype)
+    rows = [i for i, text in enumerate(texts) if text]
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        matrix[chunk] = provider.embed([texts[i] for i in chunk])
+    return matrix
+
+
+def get_embeddings(texts):
+    """Embed many texts with the selected provider, as a float32 matrix."""
+    return get_embedding_provider().embed(texts)
+
+
+def get_ada_embeddings(texts):
+    """Embed many texts with the shared OpenAI client, one API round trip per batch of unseen texts."""
+    return get_embedding_client().embed(texts).tolist()
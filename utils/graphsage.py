@@ -1,11 +1,13 @@
 import torch
 import torch.nn.functional as F
 from torch_geometric.nn import SAGEConv
+from torch_geometric.loader import DataLoader, NeighborLoader
 
 class GraphSAGE(torch.nn.Module):
     """GraphSAGE"""
     def __init__(self, dim_in, dim_h, dim_out):
         super().__init__()
+        self.dims = (dim_in, dim_h, dim_out)
         self.sage1 = SAGEConv(dim_in, dim_h)
         self.sage2 = SAGEConv(dim_h, dim_out)
         self.optimizer = torch.optim.Adam(self.parameters(), lr=0.01, weight_decay=5e-4)
@@ -17,42 +19,161 @@ class GraphSAGE(torch.nn.Module):
         h = self.sage2(h, edge_index)
         return h
 
-    def fit(self, data, train_loader, epochs):
-        criterion = torch.nn.CrossEntropyLoss()
-        optimizer = self.optimizer
+    def save(self, path):
+        """Save the model dimensions and weights to a checkpoint file."""
+        torch.save({'dims': self.dims, 'state_dict': self.state_dict()}, path)
+
+    @classmethod
+    def load(cls, path, dim_in=None):
+        """Load a model saved with save(), ready for inference; dim_in, if given, must match its input size."""
+        checkpoint = torch.load(path, map_location='cpu')
+        if dim_in is not None and checkpoint['dims'][0] != dim_in:
+            raise ValueError(f"Encoder {path} takes {checkpoint['dims'][0]}-dimensional node features, but the "
+                             f"embedding provider produces {dim_in}; select the provider it was trained with "
+                             f"(--embeddings/--embedding-dim)")
+        model = cls(*checkpoint['dims'])
+        model.load_state_dict(checkpoint['state_dict'])
+        model.eval()
+        return model
 
-        self.train()
-        for epoch in range(epochs + 1):
-            total_loss = 0
-            acc = 0
-            val_loss = 0
-            val_acc = 0
+    @torch.no_grad()
+    def embed(self, data):
+        """Forward pass only: node embeddings for `data` as a numpy array."""
+        self.eval()
+        return self(data.x, data.edge_index).numpy()
 
+    def fit(self, data, train_loader, epochs, val_loader=None, patience=None, min_delta=0.0, verbose=True):
+        """
+        Train for up to `epochs` epochs. After each training pass the model is
+        validated in eval mode without gradients, on val_loader or else on the
+        validation nodes of train_loader. Metrics stay on the device and are read
+        once per epoch. With `patience` set, training stops when the validation
+        loss has not improved by min_delta for that many epochs, and the best
+        weights are restored. verbose=False silences the progress lines.
+        """
+        criterion = torch.nn.CrossEntropyLoss(reduction='none')
+        optimizer = self.optimizer
+        val_loader = train_loader if val_loader is None else val_loader
+        best_loss, best_state, stale_epochs = float('inf'), None, 0
+
+        for epoch in range(epochs):
             # Train on batches
+            self.train()
+            total_loss, correct, seen, batches = torch.zeros(()), torch.zeros(()), torch.zeros(()), 0
             for batch in train_loader:
+                train_mask, _ = seed_masks(batch)
                 optimizer.zero_grad()
                 out = self(batch.x, batch.edge_index)
-                if out is None:
-                    print("Forward pass returned None")
-                if batch.train_mask is None or batch.y is None:
-                    print("Batch train_mask or y is None")
-                if batch.train_mask.any() and out[batch.train_mask].shape[0] != 0:
-                    loss = criterion(out[batch.train_mask], batch.y[batch.train_mask])
-                    total_loss += loss.item()
-                    acc += accuracy(out[batch.train_mask].argmax(dim=1), batch.y[batch.train_mask])
-                    loss.backward()
-                    optimizer.step()
-
-                    # Validation
-                    val_loss += criterion(out[batch.val_mask], batch.y[batch.val_mask])
-                    val_acc += accuracy(out[batch.val_mask].argmax(dim=1), batch.y[batch.val_mask])
+                loss = masked_loss(criterion, out, batch.y, train_mask)
+                loss.backward()
+                optimizer.step()
+
+                total_loss += loss.detach()
+                correct += ((out.detach().argmax(dim=1) == batch.y) & train_mask).sum()
+                seen += train_mask.sum()
+                batches += 1
+
+            # Validation
+            val_loss, val_correct, val_seen = self._validate(val_loader, criterion)
+            val_seen = val_seen.item()
+            epoch_val_loss = (val_loss / val_seen).item() if val_seen else None
 
             # Print metrics every 10 epochs
-            if epoch % 10 == 0:
-                print(f'Epoch {epoch:>3} | Train Loss: {total_loss / len(train_loader):.3f} '
-                      f'| Train Acc: {acc / len(train_loader) * 100:>6.2f}% | Val Loss: '
-                      f'{val_loss / len(train_loader):.2f} | Val Acc: '
-                      f'{val_acc / len(train_loader) * 100:.2f}%')
+            if verbose and (epoch % 10 == 0 or epoch == epochs - 1):
+                print(f'Epoch {epoch:>3} | Train Loss: {(total_loss / max(batches, 1)).item():.3f} '
+                      f'| Train Acc: {(correct / seen.clamp(min=1)).item() * 100:>6.2f}% | Val Loss: '
+                      f'{epoch_val_loss or 0:.2f} | Val Acc: '
+                      f'{(val_correct / max(val_seen, 1)).item() * 100:.2f}%')
+
+            # Early stopping on validation loss
+            if patience is None or epoch_val_loss is None:
+                continue
+            if epoch_val_loss < best_loss - min_delta:
+                best_loss, stale_epochs = epoch_val_loss, 0
+                best_state = {name: tensor.clone() for name, tensor in self.state_dict().items()}
+            else:
+                stale_epochs += 1
+                if stale_epochs >= patience:
+                    if verbose:
+                        print(f'Early stopping at epoch {epoch} | Best Val Loss: {best_loss:.3f}')
+                    break
+
+        if best_state is not None:
+            self.load_state_dict(best_state)
+        self.eval()
+
+    @torch.no_grad()
+    def _validate(self, loader, criterion):
+        """Summed validation loss, correct predictions and validation node count over a loader, without gradients."""
+        self.eval()
+        total_loss, correct, seen = torch.zeros(()), torch.zeros(()), torch.zeros(())
+        for batch in loader:
+            _, val_mask = seed_masks(batch)
+            out = self(batch.x, batch.edge_index)
+            total_loss += (criterion(out, batch.y) * val_mask).sum()
+            correct += ((out.argmax(dim=1) == batch.y) & val_mask).sum()
+            seen += val_mask.sum()
+        return total_loss, correct, seen
+
+
+class PageLoader:
+    """
+    Mini-batch loader over many page graphs.
+
+    Pages with at most max_nodes nodes are batched together, batch_size pages at a
+    time. Larger pages are split into neighbor-sampled mini-batches of
+    nodes_per_batch seed nodes each, so memory per step stays bounded. Neighbor
+    sampling needs pyg-lib or torch-sparse; without either, large pages are trained
+    whole, one page per batch. Pages without training or validation nodes are
+    dropped, and seeds are drawn from those nodes only, so no batch is empty.
+    """
+    def __init__(self, datasets, batch_size=32, num_workers=0, max_nodes=20000,
+                 num_neighbors=(25, 10), nodes_per_batch=1024, shuffle=True):
+        from torch_geometric.typing import WITH_PYG_LIB, WITH_TORCH_SPARSE
+
+        # Checked once here rather than on every training step
+        datasets = [data for data in datasets if (data.train_mask | data.val_mask).any()]
+        small = [data for data in datasets if data.num_nodes <= max_nodes]
+        large = [data for data in datasets if data.num_nodes > max_nodes]
+        self.loaders = []
+        if small:
+            self.loaders.append(DataLoader(small, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers))
+        if large and not (WITH_PYG_LIB or WITH_TORCH_SPARSE):
+            print(f"Neighbor sampling needs pyg-lib or torch-sparse; training {len(large)} page(s) over "
+                  f"{max_nodes} nodes full-batch instead")
+            self.loaders.append(DataLoader(large, batch_size=1, shuffle=shuffle, num_workers=num_workers))
+            large = []
+        for data in large:
+            self.loaders.append(NeighborLoader(data, num_neighbors=list(num_neighbors), batch_size=nodes_per_batch,
+                                               input_nodes=data.train_mask | data.val_mask, shuffle=shuffle,
+                                               num_workers=num_workers))
+
+    def __iter__(self):
+        for loader in self.loaders:
+            yield from loader
+
+    def __len__(self):
+        return sum(len(loader) for loader in self.loaders)
+
+
+def seed_masks(batch):
+    """Train and validation masks of a batch, limited to the seed nodes of a neighbor-sampled batch."""
+    if 'n_id' not in batch:
+        return batch.train_mask, batch.val_mask
+    # Sampled neighbors only provide context; the seed nodes come first
+    seeds = torch.zeros_like(batch.train_mask)
+    seeds[:batch.batch_size] = True
+    return batch.train_mask & seeds, batch.val_mask & seeds
+
+
+def masked_loss(criterion, out, y, mask):
+    """
+    Mean of a per-node criterion (reduction='none') over the masked nodes.
+
+    Multiplying by the mask instead of indexing with it keeps the shapes fixed, so
+    no step waits on the device to count the nodes; an empty mask gives a zero loss.
+    """
+    return (criterion(out, y) * mask).sum() / mask.sum().clamp(min=1)
 
 
 def accuracy(pred_y, y):
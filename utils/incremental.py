@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import numpy as np
+from utils.alignment import align_keys
+from utils.distance import Discrepancies, distance_block, find_discrepancies, prepare_embeddings
+from utils.embedding import embedding_matrix, get_embedding_provider
+from utils.config import cache_path
+
+DEFAULT_STORE_DIR = cache_path('incremental')
+
+
+def node_hashes(records):
+    """Content hash of each node on its own: tag, attributes and direct text."""
+    hashes = []
+    for record in records:
+        attrs = sorted((name, ' '.join(value) if isinstance(value, list) else value)
+                       for name, value in record['attrs'].items())
+        content = json.dumps([record['tag'], attrs, record['text']])
+        hashes.append(hashlib.sha1(content.encode('utf-8')).hexdigest())
+    return hashes
+
+
+def fingerprint(records):
+    """
+    Merkle fingerprint of a page given as node records in document order.
+
+    Each node gets its own content hash and a subtree hash over its content and the
+    subtree hashes of its children, in order, so two subtrees hash equal exactly
+    when they are identical. size is the number of nodes in each subtree.
+    """
+    own = node_hashes(records)
+    children = [[] for _ in records]
+    for record in records:
+        if record['parent'] is not None:
+            children[record['parent']].append(record['id'])
+
+    subtree = [None] * len(records)
+    size = np.ones(len(records), dtype=np.int64)
+    # Children follow their parent in document order, so a reverse pass sees them first
+    for i in range(len(records) - 1, -1, -1):
+        digest = hashlib.sha1(own[i].encode('utf-8'))
+        for child in children[i]:
+            digest.update(subtree[child].encode('utf-8'))
+            size[i] += size[child]
+        subtree[i] = digest.hexdigest()
+
+    parents = np.array([-1 if record['parent'] is None else record['parent'] for record in records], dtype=np.int64)
+    return {'tags': np.array([record['tag'] for record in records]), 'node_hash': np.array(own),
+            'subtree_hash': np.array(subtree), 'size': size, 'parents': parents}
+
+
+def children_lists(parents):
+    """Children of each node in document order, with the document roots under -1."""
+    children = {}
+    for child, parent in enumerate(parents):
+        children.setdefault(int(parent), []).append(child)
+    return children
+
+
+def match_nodes(old, new):
+    """
+    Map the nodes of a new fingerprint onto the previous one with a top-down Merkle diff.
+
+    Under each matched parent (starting from the document roots) children are first
+    paired with old children that have the same subtree hash, which maps a whole
+    unchanged subtree at once, wherever it moved among its siblings. The remaining
+    children are paired by tag in order of occurrence and compared further down.
+    Returns (mapping, inside): mapping[i] is the old index of new node i (-1 for new
+    nodes); inside[i] is True when node i lies strictly within an unchanged subtree.
+    """
+    old_children, new_children = children_lists(old['parents']), children_lists(new['parents'])
+    mapping = np.full(len(new['tags']), -1, dtype=np.int64)
+    inside = np.zeros(len(new['tags']), dtype=bool)
+    stack = [(-1, -1)]
+    while stack:
+        new_parent, old_parent = stack.pop()
+        new_kids, old_kids = new_children.get(new_parent, []), old_children.get(old_parent, [])
+        if not new_kids or not old_kids:
+            continue
+        same = align_keys([new['subtree_hash'][i] for i in new_kids], [old['subtree_hash'][j] for j in old_kids])
+        for a, b in zip(same.normal_idx, same.impaired_idx):
+            i, j = new_kids[a], old_kids[b]
+            size = new['size'][i]
+            mapping[i:i + size] = np.arange(j, j + size)
+            inside[i + 1:i + size] = True
+
+        new_rest = [new_kids[a] for a in same.unmatched_normal]
+        old_rest = [old_kids[b] for b in same.unmatched_impaired]
+        by_tag = align_keys([new['tags'][i] for i in new_rest], [old['tags'][j] for j in old_rest])
+        for a, b in zip(by_tag.normal_idx, by_tag.impaired_idx):
+            mapping[new_rest[a]] = old_rest[b]
+            stack.append((new_rest[a], old_rest[b]))
+    return mapping, inside
+
+
+def changed_neighbors(old, new, mapping, inside):
+    """Nodes (outside identical subtrees) whose parent or set of children differs from the previous run."""
+    old_children, new_children = children_lists(old['parents']), children_lists(new['parents'])
+
+    changed = np.zeros(len(mapping), dtype=bool)
+    for i in np.nonzero(~inside)[0]:
+        j = mapping[i]
+        if j < 0:
+            changed[i] = True
+            continue
+        parent = new['parents'][i]
+        if (mapping[parent] if parent >= 0 else -1) != old['parents'][j]:
+            changed[i] = True
+        elif {int(mapping[child]) for child in new_children.get(i, ())} != set(old_children.get(j, ())):
+            changed[i] = True
+    return changed
+
+
+def dom_edge_index(parents):
+    """Child edges in both directions as a (2, E) array, the 'dom' edges of nx_to_torch_geometric."""
+    child = np.nonzero(parents >= 0)[0]
+    return np.concatenate([np.stack([parents[child], child]), np.stack([child, parents[child]])], axis=1)
+
+
+def k_hop(mask, edge_index, hops):
+    """Expand a boolean node mask by `hops` steps along the edges."""
+    mask = mask.copy()
+    src, dst = edge_index
+    for _ in range(hops):
+        grown = mask.copy()
+        grown[dst[mask[src]]] = True
+        mask = grown
+    return mask
+
+
+class FingerprintStore:
+    """One .npz file per page with the fingerprints, features, embeddings and discrepancies of its last run."""
+    def __init__(self, directory=DEFAULT_STORE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def path(self, page_key):
+        return os.path.join(self.directory, hashlib.sha1(page_key.encode('utf-8')).hexdigest() + '.npz')
+
+    def load(self, page_key):
+        path = self.path(page_key)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as state:
+            return {name: state[name] for name in state.files}
+
+    def save(self, page_key, state):
+        # Write then rename, so a crash never leaves a half-written state behind
+        path = self.path(page_key)
+        temporary = path + '.tmp.npz'
+        np.savez(temporary, **state)
+        os.replace(temporary, path)
+
+
+class IncrementalScorer:
+    """
+    Re-scores a page by recomputing only what changed since its previous run.
+
+    The page's visual and impaired views are fingerprinted and matched against the
+    stored fingerprints. Only nodes whose content changed are re-embedded. With a
+    fixed (pretrained) encoder of L layers, a node's embedding only depends on its
+    L-hop neighbourhood, so only nodes within L hops of a changed node (content or
+    neighbours) are re-encoded, on the subgraph they need. Stored discrepancy pairs
+    between untouched nodes are kept, and pairs are recomputed only for the rows of
+    affected nodes. Graphs use DOM child edges only (no sibling or aria edges).
+    """
+    def __init__(self, encoder, encoder_key='', store_dir=DEFAULT_STORE_DIR, metric='euclidean',
+                 normal_threshold=0.1, impaired_threshold=0.1, block_size=1024):
+        self.encoder = encoder
+        self.hops = len(encoder.dims) - 1
+        self.store = FingerprintStore(store_dir)
+        # Stored results are only reused with the same encoder, metric and thresholds (and embedding provider)
+        self.settings = [encoder_key, list(encoder.dims), metric, normal_threshold, impaired_threshold]
+        self.metric = metric
+        self.normal_threshold = normal_threshold
+        self.impaired_threshold = impaired_threshold
+        self.block_size = block_size
+        self.last_stats = None
+
+    def _encode(self, features, edge_index, rows=None):
+        """Encoder output for all nodes, or only for `rows`, using just the subgraph those rows depend on."""
+        import torch
+        from torch_geometric.data import Data
+
+        n = len(features)
+        nodes = np.arange(n)
+        if rows is not None:
+            needed = np.zeros(n, dtype=bool)
+            needed[rows] = True
+            needed = k_hop(needed, edge_index, self.hops)
+            nodes = np.nonzero(needed)[0]
+            relabel = np.full(n, -1, dtype=np.int64)
+            relabel[nodes] = np.arange(len(nodes))
+            keep = needed[edge_index[0]] & needed[edge_index[1]]
+            edge_index = relabel[edge_index[:, keep]]
+        data = Data(x=torch.from_numpy(np.ascontiguousarray(features[nodes], dtype=np.float32)),
+                    edge_index=torch.from_numpy(np.ascontiguousarray(edge_index)))
+        embeddings = self.encoder.embed(data)
+        if rows is None:
+            return embeddings
+        return embeddings[relabel[rows]]
+
+    def _discrepancy_rows(self, normal, impaired, rows):
+        """Discrepant pairs that involve at least one of `rows`, as (i, j, normal, impaired) arrays with i < j."""
+        normal = prepare_embeddings(normal, self.metric)
+        impaired = prepare_embeddings(impaired, self.metric)
+        in_rows = np.zeros(len(normal), dtype=bool)
+        in_rows[rows] = True
+        found = []
+        for start in range(0, len(rows), self.block_size):
+            chunk = rows[start:start + self.block_size]
+            normal_block = distance_block(normal[chunk], normal, self.metric)
+            impaired_block = distance_block(impaired[chunk], impaired, self.metric)
+            mask = (normal_block < self.normal_threshold) & (impaired_block > self.impaired_threshold)
+            block_i, j = np.nonzero(mask)
+            i = chunk[block_i]
+            # A pair of two affected rows is found from both ends; keep it once
+            keep = (i != j) & ~(in_rows[j] & (j < i))
+            block_i, i, j = block_i[keep], i[keep], j[keep]
+            found.append((np.minimum(i, j), np.maximum(i, j), normal_block[block_i, j], impaired_block[block_i, j]))
+        if not found:
+            return [np.empty(0, dtype=np.int64)] * 2 + [np.empty(0)] * 2
+        return [np.concatenate(parts) for parts in zip(*found)]
+
+    def _full_pass(self, visual_features, impaired_features, edge_index):
+        normal = self._encode(visual_features, edge_index)
+        impaired = self._encode(impaired_features, edge_index)
+        discrepancies = find_discrepancies(normal, impaired, metric=self.metric, block_size=self.block_size,
+                                           normal_threshold=self.normal_threshold,
+                                           impaired_threshold=self.impaired_threshold)
+        return normal, impaired, discrepancies
+
+    def score(self, page_key, visual_records, impaired_records, provider=None):
+        """Score a page given the node records of its two views; returns Discrepancies sorted by (i, j)."""
+        new_visual = fingerprint(visual_records)
+        new_impaired = fingerprint(impaired_records)
+        edge_index = dom_edge_index(new_visual['parents'])
+        n = len(visual_records)
+        provider = provider or get_embedding_provider()
+        settings = json.dumps(self.settings + [provider.name, provider.dim])
+        state = self.store.load(page_key)
+        if state is not None and str(state['settings']) != settings:
+            state = None
+
+        if state is None:
+            visual_features = embedding_matrix([record['text'] for record in visual_records], provider=provider)
+            impaired_features = embedding_matrix([record['text'] for record in impaired_records], provider=provider)
+            normal, impaired, discrepancies = self._full_pass(visual_features, impaired_features, edge_index)
+            self.last_stats = {'nodes': n, 'reembedded': n, 'reencoded': n, 'full': True}
+        else:
+            old_visual = {name[len('visual_'):]: state[name] for name in state if name.startswith('visual_')}
+            old_impaired = {name[len('impaired_'):]: state[name] for name in state if name.startswith('impaired_')}
+            mapping, inside = match_nodes(old_visual, new_visual)
+            mapped = mapping >= 0
+
+            # Re-embed only nodes whose content changed in a view; reuse the stored rows of the others
+            features = []
+            for records, old, new, name in ((visual_records, old_visual, new_visual, 'visual'),
+                                            (impaired_records, old_impaired, new_impaired, 'impaired')):
+                same = mapped.copy()
+                same[mapped] = old['node_hash'][mapping[mapped]] == new['node_hash'][mapped]
+                matrix = np.zeros((n, state[f'{name}_features'].shape[1]), dtype=np.float32)
+                matrix[same] = state[f'{name}_features'][mapping[same]]
+                changed = np.nonzero(~same)[0]
+                matrix[changed] = embedding_matrix([records[i]['text'] for i in changed], provider=provider)
+                features.append((matrix, ~same))
+            (visual_features, visual_changed), (impaired_features, impaired_changed) = features
+
+            # Nodes whose features or neighbours changed, and everything within reach of the encoder
+            seeds = visual_changed | impaired_changed | changed_neighbors(old_visual, new_visual, mapping, inside)
+            affected = k_hop(seeds, edge_index, self.hops)
+            rows = np.nonzero(affected)[0]
+
+            if len(rows) * 2 > n:
+                # Most of the page is within reach of a change; one full pass is cheaper than row updates
+                normal, impaired, discrepancies = self._full_pass(visual_features, impaired_features, edge_index)
+            else:
+                normal = np.zeros((n, state['normal'].shape[1]), dtype=np.float32)
+                impaired = np.zeros_like(normal)
+                kept = ~affected
+                normal[kept] = state['normal'][mapping[kept]]
+                impaired[kept] = state['impaired'][mapping[kept]]
+                if len(rows):
+                    normal[rows] = self._encode(visual_features, edge_index, rows)
+                    impaired[rows] = self._encode(impaired_features, edge_index, rows)
+
+                # Keep stored pairs between untouched nodes, then add the pairs of the affected rows
+                new_index = np.full(len(old_visual['tags']), -1, dtype=np.int64)
+                new_index[mapping[kept]] = np.nonzero(kept)[0]
+                old_i, old_j = new_index[state['pairs_i']], new_index[state['pairs_j']]
+                keep = (old_i >= 0) & (old_j >= 0)
+                added = self._discrepancy_rows(normal, impaired, rows)
+                discrepancies = Discrepancies(*(np.concatenate(parts) for parts in zip(
+                    (np.minimum(old_i, old_j)[keep], np.maximum(old_i, old_j)[keep],
+                     state['pairs_normal'][keep], state['pairs_impaired'][keep]), added)))
+            self.last_stats = {'nodes': n, 'reembedded': int((visual_changed | impaired_changed).sum()),
+                               'reencoded': len(rows), 'full': False}
+
+        order = np.lexsort((discrepancies.j, discrepancies.i))
+        discrepancies = Discrepancies(*(np.asarray(values)[order] for values in discrepancies))
+        saved = {'settings': np.array(settings), 'normal': normal, 'impaired': impaired,
+                 'visual_features': visual_features, 'impaired_features': impaired_features,
+                 'pairs_i': discrepancies.i, 'pairs_j': discrepancies.j,
+                 'pairs_normal': discrepancies.normal_dist, 'pairs_impaired': discrepancies.impaired_dist}
+        saved.update({f'visual_{name}': value for name, value in new_visual.items()})
+        saved.update({f'impaired_{name}': value for name, value in new_impaired.items()})
+        self.store.save(page_key, saved)
+        return discrepancies
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import random
+import time
+
+
+class TokenBucket:
+    """Async token bucket: refills `rate` tokens per second up to `capacity`."""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        # Requests bigger than the bucket would never fit; let them through once it is full
+        tokens = min(tokens, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+def estimate_tokens(request):
+    """Rough token cost of a chat request: ~4 characters per prompt token plus the completion budget."""
+    prompt = sum(len(message['content']) for message in request['messages'])
+    return prompt // 4 + request.get('max_tokens', 0)
+
+
+class ChatExecutor:
+    """
+    Runs many chat completion requests concurrently.
+
+    At most max_in_flight requests are open at once; request and token buckets keep
+    the rate under requests_per_minute and tokens_per_minute, and rate-limited or
+    transient failures (including 5xx API errors) are retried with exponential
+    backoff. Any other failure is logged and yields None for that request only.
+    api_base (or OPENAI_API_BASE) points the executor at a different server, e.g. a
+    local stub.
+    """
+    def __init__(self, max_in_flight=8, requests_per_minute=500, tokens_per_minute=None, max_retries=5,
+                 backoff=1.0, api_base=None):
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.api_base = api_base or os.getenv("OPENAI_API_BASE")
+
+    async def _complete(self, request, semaphore, request_bucket, token_bucket):
+        import openai
+
+        kwargs = dict(request, api_base=self.api_base) if self.api_base else request
+        retryable = (openai.error.RateLimitError, openai.error.ServiceUnavailableError,
+                     openai.error.APIConnectionError, openai.error.Timeout, openai.error.TryAgain)
+        for attempt in range(self.max_retries + 1):
+            if request_bucket:
+                await request_bucket.acquire()
+            if token_bucket:
+                await token_bucket.acquire(estimate_tokens(request))
+            try:
+                async with semaphore:
+                    response = await openai.ChatCompletion.acreate(**kwargs)
+                return response.choices[0].message['content'].strip()
+            except Exception as error:
+                server_error = isinstance(error, openai.error.APIError) and (error.http_status or 0) >= 500
+                if not (isinstance(error, retryable) or server_error):
+                    print(f"LLM request failed: {type(error).__name__}: {error}")
+                    return None
+                if attempt == self.max_retries:
+                    print(f"LLM request failed after {attempt + 1} attempts: {error}")
+                    return None
+                retry_after = (getattr(error, 'headers', None) or {}).get('retry-after')
+                delay = float(retry_after) if retry_after else self.backoff * 2 ** attempt
+                await asyncio.sleep(delay * (1 + random.random() * 0.1))
+
+    async def _complete_one(self, index, request, on_result, *limits):
+        result = await self._complete(request, *limits)
+        if on_result is not None:
+            on_result(index, result)
+        return result
+
+    async def run_all(self, requests, on_result=None):
+        """
+        Return the response text of each request, in request order (None for requests that failed).
+
+        on_result(index, text) is called as each request finishes, so callers can store
+        responses as they arrive instead of after the whole batch.
+        """
+        import aiohttp
+        import openai
+
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        request_bucket = TokenBucket(self.requests_per_minute / 60) if self.requests_per_minute else None
+        token_bucket = TokenBucket(self.tokens_per_minute / 60) if self.tokens_per_minute else None
+        # One pooled HTTP session for every request instead of a new connection per call
+        async with aiohttp.ClientSession() as session:
+            openai.aiosession.set(session)
+            results = await asyncio.gather(
+                *(self._complete_one(index, request, on_result, semaphore, request_bucket, token_bucket)
+                  for index, request in enumerate(requests)),
+                return_exceptions=True
+            )
+        # One failing request must not discard the responses of the others
+        for index, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"LLM request {index} failed: {type(result).__name__}: {result}")
+                results[index] = None
+        return results
+
+    def run(self, requests, on_result=None):
+        return asyncio.run(self.run_all(list(requests), on_result=on_result))
@@ -0,0 +1,41 @@
+import importlib.util
+import os
+from bs4 import BeautifulSoup
+
+# BeautifulSoup tree builders we support, with the module each one needs installed
+PARSER_BACKENDS = {'html.parser': None, 'lxml': 'lxml', 'html5lib': 'html5lib'}
+DEFAULT_PARSER = 'html.parser'
+
+_parser = None
+
+
+def available_parsers():
+    """Names of the parser backends that can be used in this environment."""
+    return [name for name, module in PARSER_BACKENDS.items()
+            if module is None or importlib.util.find_spec(module) is not None]
+
+
+def check_parser(name):
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Unsupported parser backend: {name}")
+    if name not in available_parsers():
+        raise ValueError(f"Parser backend {name} needs the {PARSER_BACKENDS[name]} package")
+    return name
+
+
+def set_parser(name):
+    """Select the parser backend used by make_soup when no parser is given."""
+    global _parser
+    _parser = check_parser(name)
+
+
+def get_parser():
+    """The selected backend: set_parser, then the A11METRIC_PARSER variable, then html.parser."""
+    if _parser is not None:
+        return _parser
+    return check_parser(os.getenv('A11METRIC_PARSER', DEFAULT_PARSER))
+
+
+def make_soup(markup, parser=None):
+    """Parse markup with the given backend, or with the selected one."""
+    return BeautifulSoup(markup, check_parser(parser) if parser else get_parser())
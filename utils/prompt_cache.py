@@ -0,0 +1,34 @@
+import hashlib
+import os
+from utils.cache import DiskCache
+from utils.parsing import make_soup
+from utils.config import cache_path
+
+DEFAULT_CACHE_PATH = cache_path('prompts.sqlite')
+DEFAULT_TTL = 30 * 24 * 3600
+
+
+def normalize_html(html):
+    """Serialize an element so that attribute order, quoting and whitespace do not change its cache key."""
+    soup = make_soup(html, 'html.parser')
+    for tag in soup.find_all():
+        tag.attrs = dict(sorted(tag.attrs.items()))
+    return ' '.join(str(soup).split())
+
+
+def prompt_key(model, prompt_version, *parts):
+    """Cache key for an LLM response: the model, the prompt template version and a hash of the prompt inputs."""
+    digest = hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+    return f"{model}:v{prompt_version}:{digest}"
+
+
+_default_cache = None
+
+
+def get_prompt_cache():
+    """Shared response cache; A11METRIC_PROMPT_CACHE_TTL overrides the expiry (seconds)."""
+    global _default_cache
+    if _default_cache is None:
+        ttl = float(os.getenv("A11METRIC_PROMPT_CACHE_TTL", DEFAULT_TTL))
+        _default_cache = DiskCache(DEFAULT_CACHE_PATH, max_entries=50000, ttl=ttl)
+    return _default_cache
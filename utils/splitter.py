@@ -0,0 +1,103 @@
+from collections import namedtuple
+from html import escape
+from bs4.element import NavigableString, PreformattedString, Tag
+from utils.parsing import make_soup
+
+ACCESSIBILITY_ATTRS = [
+    'aria-label', 'role', 'aria-labelledby', 'aria-describedby',
+    'aria-hidden', 'tabindex', 'alt', 'aria-controls', 'aria-expanded',
+    'aria-pressed', 'aria-selected', 'aria-live', 'aria-atomic',
+    'aria-relevant', 'aria-busy', 'aria-disabled'
+]
+
+# Both views of a page as HTML, plus node records (see utils.dom_graph.node_records) for each view
+SplitViews = namedtuple('SplitViews', ['visual_html', 'impaired_html', 'visual_records', 'impaired_records'])
+
+
+def format_attrs(attrs):
+    parts = []
+    for name, value in attrs.items():
+        if value is None:
+            parts.append(f' {name}')
+            continue
+        if isinstance(value, list):
+            value = ' '.join(value)
+        parts.append(f' {name}="{escape(value, quote=True)}"')
+    return ''.join(parts)
+
+
+def split_views(html_content, visual_drop_attrs=(), parser=None):
+    """
+    Split a page into its visual and impaired views in a single traversal.
+
+    The visual view keeps the text but drops the accessibility attributes (and any
+    visual_drop_attrs). The impaired view keeps only the accessibility attributes,
+    and keeps a text node only when every enclosing tag carries an accessibility
+    attribute. Neither view deep-copies the parsed tree; both are serialized while
+    walking it, and node records for the graph builder are collected on the way.
+    """
+    soup = make_soup(html_content, parser)
+    accessibility_attrs = set(ACCESSIBILITY_ATTRS)
+    visual_dropped = accessibility_attrs | set(visual_drop_attrs)
+
+    visual, impaired = [], []
+    visual_records, impaired_records = [], []
+    visual_text, impaired_text = [], []
+    tag_counts = {}
+
+    # Stack entries: (node, parent record id, keep impaired text) or (None, closing tag, record id)
+    stack = [(child, None, True) for child in reversed(soup.contents)]
+    while stack:
+        node, parent, keep_text = stack.pop()
+
+        if node is None:
+            # parent holds the closing tag name here
+            end = f'</{parent}>'
+            visual.append(end)
+            impaired.append(end)
+            continue
+
+        if isinstance(node, Tag):
+            node_id = len(visual_records)
+            counts = tag_counts.setdefault(parent, {})
+            counts[node.name] = counts.get(node.name, 0) + 1
+            prefix = visual_records[parent]['path'] if parent is not None else ''
+            path = f"{prefix}/{node.name}[{counts[node.name]}]"
+
+            visual_attrs = {k: v for k, v in node.attrs.items() if k not in visual_dropped}
+            impaired_attrs = {k: v for k, v in node.attrs.items() if k in accessibility_attrs}
+            keep_child_text = keep_text and bool(impaired_attrs)
+
+            visual_records.append({'id': node_id, 'parent': parent, 'tag': node.name, 'attrs': visual_attrs,
+                                   'text': '', 'path': path})
+            impaired_records.append({'id': node_id, 'parent': parent, 'tag': node.name, 'attrs': impaired_attrs,
+                                     'text': '', 'path': path})
+            visual_text.append([])
+            impaired_text.append([])
+
+            if node.is_empty_element:
+                visual.append(f'<{node.name}{format_attrs(visual_attrs)}/>')
+                impaired.append(f'<{node.name}{format_attrs(impaired_attrs)}/>')
+                continue
+            visual.append(f'<{node.name}{format_attrs(visual_attrs)}>')
+            impaired.append(f'<{node.name}{format_attrs(impaired_attrs)}>')
+            stack.append((None, node.name, node_id))
+            stack.extend((child, node_id, keep_child_text) for child in reversed(node.contents))
+            continue
+
+        if isinstance(node, NavigableString):
+            output = node.output_ready()
+            visual.append(output)
+            if keep_text:
+                impaired.append(output)
+            if parent is not None and not isinstance(node, PreformattedString) and node.strip():
+                visual_text[parent].append(node.strip())
+                if keep_text:
+                    impaired_text[parent].append(node.strip())
+
+    for record, parts in zip(visual_records, visual_text):
+        record['text'] = ' '.join(parts)
+    for record, parts in zip(impaired_records, impaired_text):
+        record['text'] = ' '.join(parts)
+
+    return SplitViews(''.join(visual), ''.join(impaired), visual_records, impaired_records)
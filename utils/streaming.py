@@ -0,0 +1,179 @@
+from collections import deque
+from html.parser import HTMLParser
+import networkx as nx
+from bs4.builder import HTMLTreeBuilder
+from utils.dom_graph import ARIA_REFERENCE_ATTRS
+from utils.splitter import ACCESSIBILITY_ATTRS
+
+VOID_ELEMENTS = HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS
+# Attributes that BeautifulSoup splits into lists of values (class, rel, headers, ...)
+LIST_ATTRIBUTES = HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+ACCESSIBILITY_ATTR_SET = set(ACCESSIBILITY_ATTRS)
+
+
+def read_chunks(path, chunk_size=1 << 16):
+    """Read a text file in chunks of chunk_size characters."""
+    with open(path, 'r', encoding='utf-8') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+class StreamingDomParser(HTMLParser):
+    """
+    Event-driven HTML parser that produces node records and edges as it goes.
+
+    Only the chain of currently open elements is kept, so memory is bounded by
+    the DOM depth rather than the document size (aria reference edges also keep
+    a map of element ids). Records match utils.dom_graph.node_records: ids follow
+    document order, but a record is emitted when its element closes, once its
+    direct text is known. With view='visual' or view='impaired' the records
+    describe that view of the page, as produced by utils.splitter.split_views.
+    """
+    def __init__(self, siblings=False, aria_refs=False, view=None):
+        super().__init__(convert_charrefs=True)
+        if view not in (None, 'visual', 'impaired'):
+            raise ValueError("Unsupported view")
+        self.siblings = siblings
+        self.aria_refs = aria_refs
+        self.view = view
+        self.events = deque()
+        self.open_elements = []
+        # A text node can arrive in several handle_data calls when it spans chunks
+        self.data = []
+        self.root_counts = {}
+        self.next_id = 0
+        self.ids = {}
+        self.pending_refs = {}
+
+    def _filter_attrs(self, attrs):
+        if self.view == 'visual':
+            return {k: v for k, v in attrs.items() if k not in ACCESSIBILITY_ATTR_SET}
+        if self.view == 'impaired':
+            return {k: v for k, v in attrs.items() if k in ACCESSIBILITY_ATTR_SET}
+        return attrs
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_data()
+        attrs = {name: value if value is not None else '' for name, value in attrs}
+        for name in LIST_ATTRIBUTES['*'] | LIST_ATTRIBUTES.get(tag, set()):
+            if name in attrs:
+                attrs[name] = attrs[name].split()
+        parent = self.open_elements[-1] if self.open_elements else None
+        node_id = self.next_id
+        self.next_id += 1
+
+        counts = parent['counts'] if parent else self.root_counts
+        counts[tag] = counts.get(tag, 0) + 1
+        path = f"{parent['record']['path'] if parent else ''}/{tag}[{counts[tag]}]"
+        keep_text = parent['keep_text'] if parent else True
+        if self.view == 'impaired':
+            keep_text = keep_text and any(attr in ACCESSIBILITY_ATTR_SET for attr in attrs)
+
+        if parent:
+            self.events.append(('edge', (parent['record']['id'], node_id, 'child')))
+            if self.siblings and parent['last_child'] is not None:
+                self.events.append(('edge', (parent['last_child'], node_id, 'sibling')))
+            parent['last_child'] = node_id
+        # References resolve against the view's attributes, as build_dom_graph does on that view's records
+        view_attrs = self._filter_attrs(attrs)
+        if self.aria_refs:
+            self._link_references(node_id, view_attrs)
+
+        record = {'id': node_id, 'parent': parent['record']['id'] if parent else None, 'tag': tag,
+                  'attrs': view_attrs, 'text': '', 'path': path}
+        if tag in VOID_ELEMENTS:
+            self.events.append(('node', record))
+            return
+        self.open_elements.append({'record': record, 'text': [], 'counts': {}, 'last_child': None,
+                                   'keep_text': keep_text})
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        self._flush_data()
+        # Close up to the most recent matching element; stray end tags are ignored
+        if not any(frame['record']['tag'] == tag for frame in self.open_elements):
+            return
+        while self.open_elements:
+            frame = self.open_elements.pop()
+            self._emit(frame)
+            if frame['record']['tag'] == tag:
+                break
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_comment(self, data):
+        self._flush_data()
+
+    def handle_decl(self, decl):
+        self._flush_data()
+
+    def handle_pi(self, data):
+        self._flush_data()
+
+    def _flush_data(self):
+        text = ''.join(self.data).strip()
+        self.data = []
+        if text and self.open_elements and self.open_elements[-1]['keep_text']:
+            self.open_elements[-1]['text'].append(text)
+
+    def _emit(self, frame):
+        record = frame['record']
+        record['text'] = ' '.join(frame['text'])
+        self.events.append(('node', record))
+
+    def _link_references(self, node_id, attrs):
+        element_id = attrs.get('id')
+        if element_id and element_id not in self.ids:
+            self.ids[element_id] = node_id
+            for src in self.pending_refs.pop(element_id, []):
+                if src != node_id:
+                    self.events.append(('edge', (src, node_id, 'aria')))
+        for attr in ARIA_REFERENCE_ATTRS:
+            for ref in (attrs.get(attr) or '').split():
+                target = self.ids.get(ref)
+                if target is None:
+                    self.pending_refs.setdefault(ref, []).append(node_id)
+                elif target != node_id:
+                    self.events.append(('edge', (node_id, target, 'aria')))
+
+    def close(self):
+        super().close()
+        self._flush_data()
+        while self.open_elements:
+            self._emit(self.open_elements.pop())
+
+
+def iter_dom_events(chunks, siblings=False, aria_refs=False, view=None):
+    """Yield ('node', record) and ('edge', (src, dst, kind)) events while feeding the HTML chunks."""
+    parser = StreamingDomParser(siblings=siblings, aria_refs=aria_refs, view=view)
+    for chunk in chunks:
+        parser.feed(chunk)
+        while parser.events:
+            yield parser.events.popleft()
+    parser.close()
+    while parser.events:
+        yield parser.events.popleft()
+
+
+def graph_from_events(events):
+    """Build the same graph as utils.dom_graph.build_dom_graph from streamed events."""
+    graph = nx.Graph()
+    for kind, value in events:
+        if kind == 'node':
+            graph.add_node(value['id'], tag=value['tag'], attrs=value['attrs'], text=value['text'], path=value['path'])
+        else:
+            src, dst, edge_kind = value
+            graph.add_edge(src, dst, kind=edge_kind)
+    # Restore document order, since records arrive when their elements close
+    ordered = nx.Graph()
+    ordered.add_nodes_from(sorted(graph.nodes(data=True)))
+    ordered.add_edges_from(graph.edges(data=True))
+    return ordered